@@ -0,0 +1,418 @@
+"""Бэкенды кэша для нескольких процессов.
+
+SQLiteCache хранит кэш в одном файле SQLite, общем для всех воркеров
+на машине, и заменяет Redis-совместимый сервер там, где его нет.
+TwoTierCache держит в процессе небольшой LRU-кэш перед общим уровнем
+и сбрасывает его по штампу версии, который меняют удаление и incr.
+MeteredCache считает попадания и промахи другого кэша.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+SQLITE_TIMEOUT = 5
+# Как часто (в записях) проверять, не пора ли вытеснять старые ключи.
+CULL_CHECK_EVERY = 100
+STAMP_KEY = 'two_tier:stamp'
+
+
+class SQLiteCache(BaseCache):
+    """Общий кэш в файле SQLite (LOCATION — путь к файлу)."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(
+                self._path, timeout=SQLITE_TIMEOUT, isolation_level=None
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, expires REAL)'
+            )
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires < ?',
+                (key, time.time()),
+            )
+            inserted = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self._expiry(timeout)),
+            ).rowcount
+        self._cull()
+        return bool(inserted)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires >= ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._db.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+            'AND (expires IS NULL OR expires >= ?)',
+            (*keys, time.time()),
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._db.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+            (self._key(key, version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self._expiry(timeout)),
+        )
+        self._cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expiry(timeout)
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                ((self._key(key, version),
+                  pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+                 for key, value in data.items()),
+            )
+        self._cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires >= ?)',
+            (self._expiry(timeout), self._key(key, version), time.time()),
+        ).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires >= ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        with self._transaction() as db:
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                ((self._key(key, version),) for key in keys),
+            )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self):
+        self._writes += 1
+        if self._cull_frequency == 0 or self._writes % CULL_CHECK_EVERY:
+            return
+        db = self._db
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires < ?', (time.time(),)
+        )
+        db.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
+
+
+class _LocalTier:
+    """Уровень процесса: общий для всех потоков, как у LocMemCache."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.stamp_checked = 0
+
+
+_local_tiers = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    """LRU-кэш процесса перед общим кэшем (OPTIONS['SHARED'] — его алиас).
+
+    Записи живут в процессе не дольше LOCAL_TIMEOUT секунд. Удаление,
+    incr/decr и clear меняют штамп в общем кэше; каждый процесс
+    сверяет штамп не чаще раза в STAMP_INTERVAL секунд и при смене
+    очищает свой уровень.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._shared_alias = options.pop('SHARED', 'shared')
+        self._local_max = int(options.pop('LOCAL_MAX_ENTRIES', 1000))
+        self._local_timeout = float(options.pop('LOCAL_TIMEOUT', 30))
+        self._stamp_interval = float(options.pop('STAMP_INTERVAL', 1))
+        super().__init__({**params, 'OPTIONS': options})
+        # Django создаёт экземпляр бэкенда на каждый поток,
+        # а уровень процесса должен быть один.
+        with _local_tiers_lock:
+            self._tier = _local_tiers.setdefault(
+                location or self._shared_alias, _LocalTier()
+            )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _check_stamp(self):
+        tier = self._tier
+        now = time.monotonic()
+        if now - tier.stamp_checked < self._stamp_interval:
+            return
+        stamp = self.shared.get(STAMP_KEY)
+        with tier.lock:
+            if stamp != tier.stamp:
+                tier.entries.clear()
+                tier.stamp = stamp
+            tier.stamp_checked = now
+
+    def _bump_stamp(self):
+        try:
+            stamp = self.shared.incr(STAMP_KEY)
+        except ValueError:
+            self.shared.add(STAMP_KEY, 1, None)
+            stamp = self.shared.get(STAMP_KEY)
+        with self._tier.lock:
+            self._tier.stamp = stamp
+            self._tier.stamp_checked = time.monotonic()
+
+    def _remember(self, key, value):
+        expires = time.monotonic() + self._local_timeout
+        with self._tier.lock:
+            entries = self._tier.entries
+            entries[key] = (value, expires)
+            entries.move_to_end(key)
+            while len(entries) > self._local_max:
+                entries.popitem(last=False)
+
+    def _forget(self, keys):
+        with self._tier.lock:
+            for key in keys:
+                self._tier.entries.pop(key, None)
+
+    def _recall(self, key):
+        with self._tier.lock:
+            entries = self._tier.entries
+            entry = entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires < time.monotonic():
+                del entries[key]
+                return False, None
+            entries.move_to_end(key)
+            return True, value
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self._check_stamp()
+        found, value = self._recall(key)
+        if found:
+            return value
+        value = self.shared.get(key, self, version=0)
+        if value is self:
+            return default
+        self._remember(key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._check_stamp()
+        result, missing = {}, {}
+        for key in keys:
+            full_key = self.make_key(key, version=version)
+            found, value = self._recall(full_key)
+            if found:
+                result[key] = value
+            else:
+                missing[full_key] = key
+        if missing:
+            shared = self.shared.get_many(missing, version=0)
+            for full_key, value in shared.items():
+                self._remember(full_key, value)
+                result[missing[full_key]] = value
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        added = self.shared.add(key, value, timeout, version=0)
+        if added:
+            self._remember(key, value)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.shared.set(key, value, timeout, version=0)
+        self._remember(key, value)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        data = {
+            self.make_key(key, version=version): value
+            for key, value in data.items()
+        }
+        failed = self.shared.set_many(data, timeout, version=0)
+        for key, value in data.items():
+            self._remember(key, value)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        return self.shared.touch(key, timeout, version=0)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        value = self.shared.incr(key, delta, version=0)
+        self._bump_stamp()
+        self._remember(key, value)
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.shared.delete(key, version=0)
+        self._forget([key])
+        self._bump_stamp()
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        self.shared.delete_many(keys, version=0)
+        self._forget(keys)
+        self._bump_stamp()
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self.shared.clear()
+        with self._tier.lock:
+            self._tier.entries.clear()
+        self._bump_stamp()
+
+
+class MeteredCache(BaseCache):
+    """Обёртка над другим кэшем (OPTIONS['CACHE'] — его алиас), которая
+    считает попадания и промахи для core.metrics. Ключи и версии
+    передаются как есть: их строит внутренний кэш."""
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._alias = options.pop('CACHE')
+        super().__init__({**params, 'OPTIONS': options})
+
+    @property
+    def inner(self):
+        return caches[self._alias]
+
+    def get(self, key, default=None, version=None):
+        value = self.inner.get(key, self, version=version)
+        metrics.record_cache(value is not self, value is self)
+        return default if value is self else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        result = self.inner.get_many(keys, version=version)
+        metrics.record_cache(len(result), len(keys) - len(result))
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.inner.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.inner.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.inner.decr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        return self.inner.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self.inner.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.inner.has_key(key, version=version)  # noqa: W601
+
+    def clear(self):
+        return self.inner.clear()
+
+    def close(self, **kwargs):
+        return self.inner.close(**kwargs)
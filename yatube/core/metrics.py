@@ -0,0 +1,207 @@
+"""Замеры запросов: время ответа, SQL, шаблоны и кэш.
+
+MetricsMiddleware открывает на время запроса RequestStats в
+thread-local, и в него пишут обёртка execute_wrapper над запросами к
+базе, бэкенд шаблонов MeteredTemplates и обёртка кэша MeteredCache.
+Итоги запроса копятся по имени адреса (posts:index, posts:profile...)
+в скользящем окне из последних METRICS_WINDOW запросов: по нему
+считаются перцентили и гистограмма времени ответа.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Границы корзин гистограммы времени ответа, мс.
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+PERCENTILES = (50, 90, 95, 99)
+UNRESOLVED = 'unresolved'
+
+_local = threading.local()
+_views = {}
+_views_lock = threading.Lock()
+
+
+class RequestStats:
+    """Замеры одного запроса; время — в секундах."""
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current():
+    """Замеры текущего запроса или None вне MetricsMiddleware."""
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def measure():
+    previous = current()
+    _local.stats = stats = RequestStats()
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = current()
+        if stats is not None:
+            stats.db_count += 1
+            stats.db_time += time.perf_counter() - started
+
+
+@contextmanager
+def template_render():
+    """Засекает отрисовку шаблона. Вложенные отрисовки (render_to_string
+    внутри тега) уже входят во время внешней и не считаются."""
+    stats = current()
+    if stats is None:
+        yield
+        return
+    stats.template_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.template_depth -= 1
+        if not stats.template_depth:
+            stats.template_time += time.perf_counter() - started
+
+
+def record_cache(hits, misses):
+    stats = current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def server_timing(total, stats):
+    """Значение заголовка Server-Timing, длительности в мс."""
+    return ', '.join((
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={stats.db_time * 1000:.1f};'
+        f'desc="{stats.db_count} queries"',
+        f'tpl;dur={stats.template_time * 1000:.1f}',
+        f'cache;desc="hits {stats.cache_hits} '
+        f'misses {stats.cache_misses}"',
+    ))
+
+
+def _percentile(ordered, percent):
+    rank = max(round(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class ViewMetrics:
+    """Итоги одного адреса: счётчики с запуска процесса и окно
+    последних запросов для перцентилей."""
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, total, stats, status):
+        with self.lock:
+            self.requests += 1
+            self.errors += status >= 500
+            self.cache_hits += stats.cache_hits
+            self.cache_misses += stats.cache_misses
+            self.samples.append((
+                total, stats.db_count, stats.db_time, stats.template_time
+            ))
+
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+            summary = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+            }
+        totals = sorted(sample[0] for sample in samples)
+        count = len(samples)
+        summary['window'] = count
+        if not count:
+            return summary
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = _ms(_percentile(totals, percent))
+        summary.update(
+            mean_ms=_ms(sum(totals) / count),
+            max_ms=_ms(totals[-1]),
+            db_queries=round(sum(s[1] for s in samples) / count, 1),
+            db_queries_max=max(s[1] for s in samples),
+            db_ms=_ms(sum(s[2] for s in samples) / count),
+            template_ms=_ms(sum(s[3] for s in samples) / count),
+        )
+        buckets = {}
+        for bound in BUCKETS_MS:
+            buckets[f'le_{bound}'] = sum(
+                total * 1000 <= bound for total in totals
+            )
+        buckets['inf'] = count
+        summary['buckets'] = buckets
+        return summary
+
+
+def observe(name, total, stats, status):
+    metrics = _views.get(name)
+    if metrics is None:
+        with _views_lock:
+            metrics = _views.setdefault(
+                name, ViewMetrics(settings.METRICS_WINDOW)
+            )
+    metrics.observe(total, stats, status)
+
+
+def snapshot():
+    """Сводка по всем адресам этого процесса."""
+    with _views_lock:
+        views = dict(_views)
+    return {
+        'pid': os.getpid(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'views': {
+            name: metrics.summary() for name, metrics in sorted(
+                views.items()
+            )
+        },
+    }
+
+
+def reset():
+    with _views_lock:
+        _views.clear()
+
+
+def dump(path):
+    """Пишет сводку в файл; {pid} в пути — номер процесса, чтобы
+    воркеры не перезаписывали файлы друг друга."""
+    path = path.format(pid=os.getpid())
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(snapshot(), file, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
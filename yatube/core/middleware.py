@@ -0,0 +1,88 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, profiler
+from .querylog import QueryLog
+
+
+class MetricsMiddleware:
+    """Замеряет запрос (см. core.metrics), добавляет заголовок
+    Server-Timing и раз в METRICS_DUMP_INTERVAL секунд пишет сводку
+    в METRICS_DUMP_PATH.
+
+    Стоит первым в MIDDLEWARE, чтобы в замер попали и запросы
+    сессий и аутентификации. Для потоковых ответов замеряется
+    только время до начала передачи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.dumped = time.monotonic()
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with metrics.measure() as stats, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.record_query)
+                )
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        name = match.view_name if match else metrics.UNRESOLVED
+        metrics.observe(name, total, stats, response.status_code)
+        user = getattr(request, 'user', None)
+        if settings.METRICS_SERVER_TIMING or (user and user.is_staff):
+            response['Server-Timing'] = metrics.server_timing(total, stats)
+        self.dump()
+        return response
+
+    def dump(self):
+        path = settings.METRICS_DUMP_PATH
+        if not path:
+            return
+        now = time.monotonic()
+        if now - self.dumped < settings.METRICS_DUMP_INTERVAL:
+            return
+        self.dumped = now
+        metrics.dump(path)
+
+
+class QueryLogMiddleware:
+    """Журнал запросов ответа: медленные, повторы и бюджет адреса
+    (см. core.querylog)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        log = QueryLog()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            response = self.get_response(request)
+        match = request.resolver_match
+        log.check(match.view_name if match else metrics.UNRESOLVED)
+        return response
+
+
+class ProfilerMiddleware:
+    """Отмечает для профилировщика, какой адрес обслуживает поток
+    (см. core.profiler). Пока профилировщик выключен, ничего не делает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.request_finished()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if profiler.sampler.running:
+            profiler.request_started(request.resolver_match.view_name)
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 
 
 class CreatedModel(models.Model):
@@ -11,3 +11,62 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class VersionedModel(CreatedModel):
+    """Абстрактная модель. Добавляет дату изменения и номер версии,
+    который растёт при каждом сохранении: по ним строятся ключи кэша
+    и ETag. У строк, загруженных в обход ORM, даты изменения нет."""
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        null=True,
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=1,
+        editable=False,
+    )
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if not update_fields:
+                # Пустой update_fields у Django ничего не пишет.
+                return
+            kwargs['update_fields'] = {*update_fields, 'updated', 'version'}
+        # Увеличение в самом UPDATE: две одновременные правки не
+        # получат один номер. Новый номер читается в той же транзакции,
+        # до сигнала post_save (см. _do_update).
+        self._version_before = self.version
+        self.version = models.F('version') + 1
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        try:
+            with transaction.atomic(using=using, savepoint=False):
+                super().save(*args, **kwargs)
+        except Exception:
+            self.version = self._version_before
+            raise
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields,
+                   forced_update):
+        updated = super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+        if not isinstance(self.version, models.Expression):
+            return updated
+        if updated:
+            self.version = base_qs.filter(pk=pk_val).values_list(
+                'version', flat=True
+            ).get()
+        else:
+            # Строки нет, Django перейдёт к INSERT: номер — обычное число.
+            self.version = self._version_before
+        return updated
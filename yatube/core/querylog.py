@@ -0,0 +1,112 @@
+"""Журнал запросов к базе: медленные запросы, N+1 и бюджеты.
+
+QueryLogMiddleware ставит на время ответа QueryLog обёрткой
+connection.execute_wrapper. Запросы дольше SLOW_QUERY_MS пишутся в лог
+сразу, с местом в коде проекта и строкой шаблона, откуда они пришли.
+Запросы сравниваются по форме — SQL без значений, — и форма,
+повторённая за ответ DUPLICATE_QUERY_THRESHOLD раз, попадает в лог как
+вероятный N+1. Число запросов адреса сверяется с QUERY_BUDGETS; при
+QUERY_BUDGETS_STRICT превышение — исключение, а не запись в лог.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Файлы, которые не считаются местом вызова запроса.
+SKIPPED_FILES = ('querylog.py', 'metrics.py', 'middleware.py')
+# Сколько строк кода проекта показывать, от самой глубокой.
+ORIGIN_FRAMES = 3
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def shape(sql):
+    """Форма запроса: списки IN свёрнуты, литералы заменены на «?»."""
+    return LITERAL.sub('?', IN_LIST.sub('(...)', sql))
+
+
+def origin():
+    """Откуда пришёл запрос: строка шаблона, который в этот момент
+    отрисовывался, и ближайшие строки кода проекта в стеке."""
+    template = None
+    code = []
+    render = Node.render_annotated.__code__
+    frame = sys._getframe(1)
+    while frame is not None and len(code) < ORIGIN_FRAMES:
+        if template is None and frame.f_code is render:
+            node = frame.f_locals['self']
+            template = (
+                f'{node.origin.template_name or node.origin.name}:'
+                f'{node.token.lineno}'
+            )
+        filename = frame.f_code.co_filename
+        if (filename.startswith(settings.BASE_DIR)
+                and os.path.basename(filename) not in SKIPPED_FILES):
+            code.append(
+                f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                f'{frame.f_lineno} in {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return ' < '.join(filter(None, (template, *code))) or 'unknown'
+
+
+class QueryLog:
+    """Запросы одного ответа."""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            query = shape(sql)
+            self.shapes[query] += 1
+            if self.shapes[query] == 2:
+                self.origins[query] = origin()
+            if elapsed >= settings.SLOW_QUERY_MS:
+                logger.warning(
+                    'Медленный запрос, %.1f мс (%s): %s',
+                    elapsed, origin(), sql,
+                )
+
+    def duplicates(self):
+        """Формы, повторённые не реже порога, с местом повтора."""
+        return [
+            (query, count, self.origins[query])
+            for query, count in self.shapes.most_common()
+            if count >= settings.DUPLICATE_QUERY_THRESHOLD
+        ]
+
+    def check(self, view_name):
+        for query, count, place in self.duplicates():
+            logger.warning(
+                '%s: запрос повторён %d раз (%s): %s',
+                view_name, count, place, query,
+            )
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is None or self.count <= budget:
+            return
+        message = (
+            f'{view_name}: {self.count} запросов при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGETS_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.error(message)
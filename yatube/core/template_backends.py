@@ -0,0 +1,21 @@
+"""Бэкенд шаблонов Django, который засекает время отрисовки
+для core.metrics."""
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+
+
+class MeteredTemplate(Template):
+    def render(self, context=None, request=None):
+        with metrics.template_render():
+            return super().render(context, request)
+
+
+class MeteredTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return MeteredTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return MeteredTemplate(template.template, self)
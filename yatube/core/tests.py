@@ -0,0 +1,253 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from django.template import engines
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics, profiler
+from core.querylog import QueryBudgetExceeded, QueryLog, shape
+
+User = get_user_model()
+
+TEMP_DIR = tempfile.mkdtemp()
+CACHE_PATH = os.path.join(TEMP_DIR, 'cache.sqlite3')
+TWO_TIER_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {'SHARED': 'shared', 'STAMP_INTERVAL': 0},
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': CACHE_PATH,
+    },
+}
+
+
+@override_settings(CACHES=TWO_TIER_CACHES)
+class CacheBackendsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.shared = caches['shared']
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_sqlite_cache_operations(self):
+        """SQLite-кэш поддерживает основные операции кэша"""
+        shared = self.shared
+        shared.set('key', {'value': 1})
+        self.assertEqual(shared.get('key'), {'value': 1})
+        self.assertFalse(shared.add('key', 'other'))
+        self.assertTrue(shared.add('new', 'value'))
+        shared.set('number', 1)
+        self.assertEqual(shared.incr('number', 5), 6)
+        self.assertEqual(
+            shared.get_many(['key', 'number', 'missing']),
+            {'key': {'value': 1}, 'number': 6},
+        )
+        shared.set('expired', 'value', timeout=-1)
+        self.assertIsNone(shared.get('expired'))
+        shared.delete_many(['key', 'number'])
+        self.assertIsNone(shared.get('key'))
+
+    def test_two_tier_reads_through_and_invalidates(self):
+        """Двухуровневый кэш читает общий уровень и сбрасывается
+        по штампу после удаления ключа в другом процессе"""
+        self.shared.set(self.cache.make_key('key'), 'shared', version=0)
+        self.assertEqual(self.cache.get('key'), 'shared')
+        # Другой процесс меняет ключ в общем кэше в обход
+        # локального уровня: до смены штампа виден локальный ответ.
+        self.shared.set(self.cache.make_key('key'), 'changed', version=0)
+        self.assertEqual(self.cache.get('key'), 'shared')
+        self.shared.set('two_tier:stamp', 'другой процесс')
+        self.assertEqual(self.cache.get('key'), 'changed')
+
+    def test_two_tier_write_through(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(
+            self.shared.get(self.cache.make_key('key'), version=0), 'value'
+        )
+        self.cache.set('number', 1)
+        self.assertEqual(self.cache.incr('number'), 2)
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+
+class CacheSettingsTest(TestCase):
+    def test_cache_sized_for_cards(self):
+        """Кэш по умолчанию не упирается в 300 записей BaseCache"""
+        default = caches['metered']
+        self.assertEqual(default._max_entries,
+                         settings.CACHE_LOCAL_MAX_ENTRIES)
+        for i in range(400):
+            default.set(f'card:{i}', i)
+        self.assertEqual(default.get('card:0'), 0)
+
+
+@override_settings(METRICS_SERVER_TIMING=True)
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+        cache.clear()
+        self.client = Client()
+
+    def timing(self, response):
+        return dict(
+            part.strip().split(';', 1)
+            for part in response['Server-Timing'].split(',')
+        )
+
+    def test_server_timing(self):
+        """Ответ несёт Server-Timing с SQL, шаблонами и кэшем"""
+        timing = self.timing(self.client.get(reverse('posts:index')))
+        self.assertEqual(set(timing), {'total', 'db', 'tpl', 'cache'})
+        self.assertNotIn('desc="0 queries"', timing['db'])
+        self.assertNotEqual(timing['tpl'], 'dur=0.0')
+        # Второй раз лента берётся из кэша.
+        timing = self.timing(self.client.get(reverse('posts:index')))
+        self.assertNotIn('desc="hits 0 ', timing['cache'])
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_only_for_staff(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('Server-Timing', response)
+
+    def test_metrics_endpoint(self):
+        """Сводка по адресам доступна только staff и пишется в файл"""
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics-{pid}.json')
+            with self.settings(METRICS_DUMP_PATH=path):
+                views = self.client.get(url, {'dump': 1}).json()['views']
+            with open(path.format(pid=os.getpid())) as file:
+                self.assertEqual(json.load(file)['views'], views)
+        index = views['posts:index']
+        self.assertEqual(index['requests'], 3)
+        self.assertEqual(index['buckets']['inf'], 3)
+        self.assertGreater(index['db_queries'], 0)
+        self.assertGreaterEqual(index['p99_ms'], index['p50_ms'])
+
+
+class QueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(6):
+            User.objects.create_user(username=f'user{number}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_shape(self):
+        """Форма запроса не зависит от значений и длины списка IN"""
+        self.assertEqual(
+            shape("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s) "
+                  "LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?',
+        )
+
+    def test_duplicates_point_to_template_line(self):
+        """Повторы запроса (N+1) находятся со строкой шаблона"""
+        template = engines['django'].from_string(
+            'Пользователи:\n'
+            '{% for user in users %}{{ user.follower.count }}{% endfor %}'
+        )
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            template.render({'users': User.objects.all()})
+        [(query, count, place)] = log.duplicates()
+        self.assertEqual(count, 6)
+        self.assertIn('posts_follow', query)
+        self.assertIn(':2', place)
+        self.assertIn('core/tests.py', place)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_logged(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts/views.py', '\n'.join(logs.output))
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_query_budget(self):
+        """Превышение бюджета запросов роняет тест или пишется в лог"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('posts:index'))
+        cache.clear()
+        with self.settings(QUERY_BUDGETS_STRICT=False):
+            with self.assertLogs('core.querylog', 'ERROR'):
+                self.client.get(reverse('posts:index'))
+
+
+class ProfilerTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.staff = User.objects.create_user(username='staff',
+                                              is_staff=True)
+
+    def tearDown(self):
+        profiler.sampler.stop()
+        profiler.request_finished()
+
+    def test_sample_collapsed_stacks(self):
+        """Выборка берёт стеки потоков отмеченных адресов"""
+        sampler = profiler.Sampler()
+        sampler.views = ('posts:*',)
+        profiler.request_started('posts:profile')
+        sampler.sample()
+        profiler.request_started('users:login')
+        sampler.sample()
+        [line] = sampler.collapsed().splitlines()
+        stack, count = line.rsplit(' ', 1)
+        self.assertEqual(count, '1')
+        self.assertTrue(stack.startswith('posts:profile;'))
+        self.assertIn(
+            'core/tests.py:test_sample_collapsed_stacks;', stack
+        )
+
+    def test_profiler_endpoints(self):
+        """Профилировщик включается и отдаёт стеки только staff"""
+        url = reverse('core:profiler_start')
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.client.force_login(self.staff)
+        status = self.client.post(
+            url, {'views': 'posts:index', 'interval': 1}
+        ).json()
+        self.assertTrue(status['running'])
+        self.assertEqual(status['views'], ['posts:index'])
+        deadline = time.monotonic() + 5
+        while not profiler.sampler.samples and time.monotonic() < deadline:
+            self.client.get(reverse('posts:index'))
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(PROFILER_OUTPUT_DIR=directory):
+                status = self.client.post(
+                    reverse('core:profiler_stop')
+                ).json()
+            self.assertFalse(status['running'])
+            self.assertTrue(os.path.exists(status['path']))
+        response = self.client.get(reverse('core:profiler_stacks'))
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertTrue(
+            response.content.decode().startswith('posts:index;')
+        )
@@ -1 +1,17 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiler/', views.profiler_status, name='profiler'),
+    path('profiler/start/', views.profiler_start, name='profiler_start'),
+    path('profiler/stop/', views.profiler_stop, name='profiler_stop'),
+    path(
+        'profiler/stacks/', views.profiler_stacks, name='profiler_stacks'
+    ),
+]
+
 handler404 = 'core.views.page_not_found'
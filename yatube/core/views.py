@@ -1,4 +1,11 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_POST
+
+from . import metrics as request_metrics
+from .profiler import sampler
 
 
 def page_not_found(request, exception):
@@ -7,3 +14,61 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def metrics(request):
+    """Сводка замеров этого процесса; ?dump=1 заодно пишет её
+    в METRICS_DUMP_PATH, ?reset=1 после выдачи обнуляет."""
+    snapshot = request_metrics.snapshot()
+    if request.GET.get('dump') and settings.METRICS_DUMP_PATH:
+        request_metrics.dump(settings.METRICS_DUMP_PATH)
+    if request.GET.get('reset'):
+        request_metrics.reset()
+    return JsonResponse(snapshot, json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def profiler_status(request):
+    return JsonResponse(sampler.status())
+
+
+@staff_member_required
+@require_POST
+def profiler_start(request):
+    """Включает профилировщик в этом воркере. views — шаблоны адресов
+    через запятую, interval — шаг в мс, seconds — длительность."""
+    views = [
+        view.strip() for view in request.POST.get('views', '').split(',')
+        if view.strip()
+    ]
+    try:
+        interval = float(request.POST.get('interval') or 0)
+        seconds = float(request.POST.get('seconds') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Неверные interval или seconds'},
+                            status=400)
+    sampler.start(views, interval, seconds)
+    return JsonResponse(sampler.status())
+
+
+@staff_member_required
+@require_POST
+def profiler_stop(request):
+    sampler.stop()
+    status = sampler.status()
+    if settings.PROFILER_OUTPUT_DIR:
+        status['path'] = sampler.dump(settings.PROFILER_OUTPUT_DIR)
+    return JsonResponse(status)
+
+
+@staff_member_required
+def profiler_stacks(request):
+    """Стеки в свёрнутом формате для flamegraph.pl или speedscope."""
+    response = HttpResponse(
+        sampler.collapsed(), content_type='text/plain; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="profile-{sampler.status()["pid"]}.folded"'
+    )
+    return response
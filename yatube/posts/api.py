@@ -0,0 +1,281 @@
+"""JSON API только для чтения: ленты и пост с комментариями.
+
+Повторяет index, group_posts, profile, follow_index и post_detail для
+мобильных клиентов. Строки читаются кортежами values_list() без
+моделей и шаблонов и сразу пишутся в компактный JSON.
+
+Параметры списков:
+    fields — поля через запятую; от них зависят колонки и JOIN-ы
+             запроса (без author и group нет JOIN с их таблицами);
+    cursor — next_cursor прошлого ответа, пагинация по (created, id);
+    limit  — размер страницы, не больше MAX_LIMIT.
+Страницы больше STREAM_LIMIT отдаются потоком: строки читаются из базы
+пачками и пишутся в ответ, не собираясь в памяти.
+"""
+import json
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import etag, require_safe
+
+from . import counters, etags, follows, timeline
+from .models import Comment, Group, Post, User
+from .utils import (COMMENTS_NUMBER, CURSOR_PARAM, NEXT, POSTS_NUMBER,
+                    decode_cursor, encode_key, older_than)
+
+MAX_LIMIT = 1000
+# Страницы больше этой отдаются StreamingHttpResponse.
+STREAM_LIMIT = 100
+CHUNK_SIZE = 500
+CONTENT_TYPE = 'application/json'
+# Поле ответа -> колонки values_list(), из которых оно собирается.
+POST_FIELDS = {
+    'id': ('id',),
+    'text': ('text',),
+    'created': ('created',),
+    'updated': ('updated',),
+    'version': ('version',),
+    'image': ('image',),
+    'author': ('author__username',),
+    'author_name': ('author__first_name', 'author__last_name'),
+    'group': ('group__slug',),
+    'group_title': ('group__title',),
+}
+POST_DEFAULT = (
+    'id', 'text', 'created', 'image', 'author', 'author_name',
+    'group', 'group_title',
+)
+COMMENT_FIELDS = {
+    'id': ('id',),
+    'text': ('text',),
+    'created': ('created',),
+    'updated': ('updated',),
+    'author': ('author__username',),
+    'author_name': ('author__first_name', 'author__last_name'),
+}
+COMMENT_DEFAULT = ('id', 'text', 'created', 'author', 'author_name')
+# Колонки ключа пагинации идут первыми в каждой строке.
+KEY_COLUMNS = ('created', 'id')
+
+_dumps = json.JSONEncoder(
+    ensure_ascii=False, separators=(',', ':')
+).encode
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _datetime(value):
+    return value and value.isoformat()
+
+
+def _image(name):
+    return default_storage.url(name) if name else None
+
+
+def _full_name(first_name, last_name):
+    return f'{first_name} {last_name}'.strip()
+
+
+CONVERTERS = {
+    'created': _datetime,
+    'updated': _datetime,
+    'image': _image,
+    'author_name': _full_name,
+}
+
+
+def api_view(view):
+    """GET и HEAD; ошибки запроса и 404 — JSON, а не HTML-страница."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        except Http404:
+            return JsonResponse({'error': 'not found'}, status=404)
+    return wrapper
+
+
+def _plan(request, available, default, param='fields'):
+    """Колонки values_list() и для каждого поля ответа — номера его
+    колонок в строке и преобразование значений."""
+    fields = request.GET.get(param)
+    fields = fields.split(',') if fields else default
+    unknown = set(fields) - set(available)
+    if unknown:
+        raise BadRequest(f'unknown fields: {", ".join(sorted(unknown))}')
+    columns = list(KEY_COLUMNS)
+    plan = []
+    for name in dict.fromkeys(fields):
+        positions = []
+        for column in available[name]:
+            if column not in columns:
+                columns.append(column)
+            positions.append(columns.index(column))
+        plan.append((name, positions, CONVERTERS.get(name)))
+    return columns, plan
+
+
+def _item(plan, values):
+    item = {}
+    for name, positions, convert in plan:
+        if convert is None:
+            item[name] = values[positions[0]]
+        else:
+            item[name] = convert(*[values[p] for p in positions])
+    return item
+
+
+def _limit(request, default):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _chunks(head, rows, plan, limit):
+    """Ответ кусками: поля head, results из строк и next_cursor.
+
+    Из rows читается limit + 1 строка: лишняя говорит, что дальше
+    есть ещё записи, и курсор строится по последней отданной.
+    """
+    parts = [_dumps(head)[:-1]]
+    if head:
+        parts.append(',')
+    parts.append('"results":[')
+    last = next_cursor = None
+    for number, values in enumerate(rows):
+        if number == limit:
+            next_cursor = encode_key(NEXT, last[0], last[1])
+            break
+        if number:
+            parts.append(',')
+        parts.append(_dumps(_item(plan, values)))
+        last = values
+        if len(parts) >= CHUNK_SIZE:
+            yield ''.join(parts)
+            parts = []
+    parts.append(f'],"next_cursor":{_dumps(next_cursor)}}}')
+    yield ''.join(parts)
+
+
+def _list(request, queryset, head=None, fields=POST_FIELDS,
+          default=POST_DEFAULT, per_page=POSTS_NUMBER):
+    """Страница записей queryset от новых к старым."""
+    columns, plan = _plan(request, fields, default)
+    limit = _limit(request, per_page)
+    cursor = request.GET.get(CURSOR_PARAM)
+    position = decode_cursor(cursor) if cursor else None
+    # Испорченный курсор, как и в HTML-лентах, даёт первую страницу.
+    if position is not None and position[0] == NEXT:
+        queryset = older_than(queryset, position[1], position[2])
+    rows = queryset.order_by('-created', '-pk').values_list(
+        *columns
+    )[:limit + 1]
+    if limit > STREAM_LIMIT:
+        return StreamingHttpResponse(
+            _chunks(head or {}, rows.iterator(CHUNK_SIZE), plan, limit),
+            content_type=CONTENT_TYPE,
+        )
+    return HttpResponse(
+        ''.join(_chunks(head or {}, rows, plan, limit)),
+        content_type=CONTENT_TYPE,
+    )
+
+
+@etag(etags.index)
+@api_view
+def index(request):
+    return _list(request, Post.objects.all())
+
+
+@etag(etags.group_posts)
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(
+        Group.objects.values('id', 'slug', 'title', 'description'),
+        slug=slug,
+    )
+    group['posts_count'] = counters.get_count(
+        counters.GROUP_POSTS, group['id']
+    )
+    return _list(
+        request, Post.objects.filter(group_id=group.pop('id')),
+        head={'group': group},
+    )
+
+
+@etag(etags.profile)
+@api_view
+def profile(request, username):
+    author = get_object_or_404(
+        User.objects.values('id', 'username', 'first_name', 'last_name'),
+        username=username,
+    )
+    author_id = author['id']
+    head = {'author': {
+        'username': author['username'],
+        'name': _full_name(author['first_name'], author['last_name']),
+        'posts_count': counters.get_count(
+            counters.AUTHOR_POSTS, author_id
+        ),
+        'following': follows.is_following(request.user, author_id),
+    }}
+    return _list(
+        request, Post.objects.filter(author_id=author_id), head=head
+    )
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'not authenticated'}, status=401)
+    return _list(request, timeline.feed(request.user))
+
+
+@etag(etags.post_detail)
+@api_view
+def post_detail(request, post_id):
+    """Пост и первая страница комментариев к нему. Поля поста —
+    fields, комментариев — comment_fields."""
+    columns, plan = _plan(request, POST_FIELDS, POST_DEFAULT)
+    values = Post.objects.filter(pk=post_id).values_list(*columns).first()
+    if values is None:
+        raise Http404
+    head = {
+        'post': _item(plan, values),
+        'comments_count': counters.get_count(
+            counters.POST_COMMENTS, post_id
+        ),
+    }
+    columns, plan = _plan(
+        request, COMMENT_FIELDS, COMMENT_DEFAULT, param='comment_fields'
+    )
+    rows = Comment.objects.filter(post_id=post_id).order_by(
+        '-created', '-pk'
+    ).values_list(*columns)[:COMMENTS_NUMBER + 1]
+    return HttpResponse(
+        ''.join(_chunks(head, rows, plan, COMMENTS_NUMBER)),
+        content_type=CONTENT_TYPE,
+    )
+
+
+@etag(etags.post_detail)
+@api_view
+def post_comments(request, post_id):
+    """Комментарии поста от новых к старым, с курсором; fields —
+    поля комментариев."""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return _list(
+        request, Comment.objects.filter(post_id=post_id),
+        fields=COMMENT_FIELDS, default=COMMENT_DEFAULT,
+        per_page=COMMENTS_NUMBER,
+    )
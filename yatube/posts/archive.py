@@ -0,0 +1,142 @@
+"""Потоковая выгрузка архива автора: все его посты и комментарии.
+
+Строки читаются курсором values_list().iterator() пачками по
+CHUNK_SIZE и сразу пишутся в ответ StreamingHttpResponse. В памяти
+держится одна пачка, сколько бы постов ни было у автора.
+
+Чтобы одна выгрузка не забрала воркеры и базу у остальных запросов:
+одновременно идёт не больше POSTS_EXPORT_CONCURRENCY выгрузок на
+процесс и одна на пользователя (остальным — 429 с Retry-After), а
+скорость ограничена POSTS_EXPORT_ROWS_PER_SECOND строк в секунду:
+между пачками выгрузка спит, отдавая процессор другим потокам.
+"""
+import csv
+import io
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .models import Comment, Post
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CHUNK_SIZE = 500
+RETRY_AFTER = 30
+# Тип строки и поля values_list() в порядке колонок.
+TABLES = (
+    ('post', Post, {
+        'id': 'id',
+        'group': 'group__slug',
+        'text': 'text',
+        'created': 'created',
+        'updated': 'updated',
+        'version': 'version',
+        'image': 'image',
+    }),
+    ('comment', Comment, {
+        'id': 'id',
+        'post': 'post_id',
+        'text': 'text',
+        'created': 'created',
+        'updated': 'updated',
+    }),
+)
+CSV_COLUMNS = (
+    'type', 'id', 'post', 'group', 'text', 'created', 'updated',
+    'version', 'image',
+)
+
+_lock = threading.Lock()
+_active_users = set()
+
+
+def _plain(name, value):
+    if name == 'image':
+        return default_storage.url(value) if value else None
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def acquire(user_id):
+    """Занимает место для выгрузки; False — мест нет или у
+    пользователя уже идёт выгрузка."""
+    with _lock:
+        if (user_id in _active_users or len(_active_users)
+                >= settings.POSTS_EXPORT_CONCURRENCY):
+            return False
+        _active_users.add(user_id)
+        return True
+
+
+def release(user_id):
+    with _lock:
+        _active_users.discard(user_id)
+
+
+def rows(author_id):
+    """Словари строк архива: сначала посты, потом комментарии."""
+    for kind, model, columns in TABLES:
+        values_list = model.objects.filter(
+            author_id=author_id
+        ).order_by('pk').values_list(*columns.values())
+        for values in values_list.iterator(chunk_size=CHUNK_SIZE):
+            row = {'type': kind}
+            for name, value in zip(columns, values):
+                row[name] = _plain(name, value)
+            yield row
+
+
+class ArchiveStream:
+    """Содержимое ответа: куски NDJSON или CSV по CHUNK_SIZE строк.
+
+    Место выгрузки (acquire) освобождается в close(), который Django
+    вызывает по окончании ответа, даже если клиент ушёл раньше.
+    """
+
+    def __init__(self, author_id, file_format):
+        self.author_id = author_id
+        self.file_format = file_format
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            yield from self._chunks()
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            release(self.author_id)
+
+    def _chunks(self):
+        buffer = io.StringIO()
+        if self.file_format == 'csv':
+            writer = csv.DictWriter(buffer, CSV_COLUMNS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(row):
+                buffer.write(json.dumps(row, ensure_ascii=False))
+                buffer.write('\n')
+        rate = settings.POSTS_EXPORT_ROWS_PER_SECOND
+        started = time.monotonic()
+        written = 0
+        for row in rows(self.author_id):
+            write(row)
+            written += 1
+            if written % CHUNK_SIZE:
+                continue
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if rate:
+                ahead = written / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        yield buffer.getvalue()
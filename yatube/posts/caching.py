@@ -0,0 +1,105 @@
+"""Кэширование фрагментов лент.
+
+Карточка поста кэшируется по id и версии поста (Post.version) и
+сбрасывается при его удалении. Лента главной страницы кэшируется под
+номером версии, который увеличивается при любом изменении постов,
+поэтому TTL может быть долгим, а новый пост виден сразу.
+
+Такие же номера версий есть у отдельного поста, автора и группы
+(scope_versions): из них строятся ETag страниц. Загрузка в обход ORM
+увеличивает общее поколение, и все версии разом устаревают.
+
+Версии областей живут только в кэше. Это не отметка времени
+последнего изменения: при вытеснении или очистке кэша номер заводится
+заново от time_ns() и только меняет ETag и ключи. Дата и номер правки
+самого поста или комментария хранятся в базе (updated, version).
+"""
+import itertools
+import time
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+FEED_VERSION_KEY = 'feed_version'
+SCOPE_VERSION_KEY = 'version:{}:{}'
+GENERATION_KEY = 'version:generation'
+POST = 'post'
+AUTHOR = 'author'
+GROUP = 'group'
+CARD_FRAGMENT = 'post_card'
+# Варианты ссылок под карточкой: show_profile_link, show_group_link.
+CARD_LINK_VARIANTS = tuple(itertools.product('01', repeat=2))
+
+
+def _versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальное значение от времени, чтобы после вытеснения
+            # ключа версия не совпала с одной из уже выданных.
+            cache.add(key, time.time_ns() // 1000, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    # incr, а не set: в TwoTierCache только incr и delete сбрасывают
+    # уровень процесса в других воркерах.
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            _versions([key])
+
+
+def feed_version():
+    return _versions([FEED_VERSION_KEY])[0]
+
+
+def bump_feed_version():
+    _bump([FEED_VERSION_KEY])
+
+
+def scope_key(scope, object_id):
+    return SCOPE_VERSION_KEY.format(scope, object_id)
+
+
+def scope_versions(scopes):
+    """Версии областей [(POST, 1), (AUTHOR, 2), ...] и общее
+    поколение последним элементом."""
+    return _versions(
+        [scope_key(*scope) for scope in scopes] + [GENERATION_KEY]
+    )
+
+
+def bump_scopes(scopes):
+    _bump({scope_key(*scope) for scope in scopes if scope[1] is not None})
+
+
+def bump_generation():
+    _bump([GENERATION_KEY])
+
+
+def card_key(post_id, version, show_profile_link=False,
+             show_group_link=False):
+    """Ключ фрагмента post_card из includes/post.html. Версия поста в
+    ключе: правка поста сама уводит ленты на новую карточку."""
+    return make_template_fragment_key(CARD_FRAGMENT, [
+        post_id, version, '1' if show_profile_link else '0',
+        '1' if show_group_link else '0',
+    ])
+
+
+def card_keys(post_id, version):
+    return [
+        card_key(post_id, version, *(links == '1' for links in variant))
+        for variant in CARD_LINK_VARIANTS
+    ]
+
+
+def forget_cards(posts):
+    """Удаляет карточки постов; posts — пары (id, версия)."""
+    keys = []
+    for post_id, version in posts:
+        keys.extend(card_keys(post_id, version))
+    cache.delete_many(keys)
@@ -0,0 +1,126 @@
+from collections import Counter as Tally
+
+from django.db import connection
+from django.db.models import Count, F, Sum
+
+from .models import Comment, Counter, Follow, Post
+
+POSTS = 'posts'
+AUTHOR_POSTS = 'author_posts'
+GROUP_POSTS = 'group_posts'
+POST_COMMENTS = 'post_comments'
+FOLLOWERS = 'followers'
+
+
+def change(name, object_id=0, delta=1):
+    """Атомарно изменяет счётчик на delta, создавая его при отсутствии."""
+    if not delta or object_id is None:
+        return
+    updated = Counter.objects.filter(
+        name=name, object_id=object_id
+    ).update(value=F('value') + delta)
+    if updated:
+        return
+    counter, created = Counter.objects.get_or_create(
+        name=name, object_id=object_id, defaults={'value': delta}
+    )
+    if not created:
+        Counter.objects.filter(pk=counter.pk).update(
+            value=F('value') + delta
+        )
+
+
+def change_many(name, object_ids, delta=1):
+    """change для многих объектов сразу: недостающие счётчики
+    создаются одним INSERT, значения меняются одним UPDATE."""
+    object_ids = list(object_ids)
+    if not delta or not object_ids:
+        return
+    ops = connection.ops
+    rows = ', '.join(['(%s, %s, 0)'] * len(object_ids))
+    params = [value for pk in object_ids for value in (name, pk)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{ops.quote_name(Counter._meta.db_table)} '
+            f'(name, object_id, value) VALUES {rows} '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            params,
+        )
+    Counter.objects.filter(
+        name=name, object_id__in=object_ids
+    ).update(value=F('value') + delta)
+
+
+def get_count(name, object_id=0):
+    value = Counter.objects.filter(
+        name=name, object_id=object_id
+    ).values_list('value', flat=True).first()
+    return max(value or 0, 0)
+
+
+def get_follow_count(user):
+    """Число постов в ленте подписок: сумма счётчиков авторов."""
+    followed = Follow.objects.filter(user=user).values('author_id')
+    total = Counter.objects.filter(
+        name=AUTHOR_POSTS, object_id__in=followed
+    ).aggregate(total=Sum('value'))['total']
+    return max(total or 0, 0)
+
+
+def forget(name, object_id):
+    Counter.objects.filter(name=name, object_id=object_id).delete()
+
+
+def posts_added(posts, sign=1):
+    """Учитывает пачку постов, созданных в обход save()."""
+    posts = list(posts)
+    change(POSTS, delta=sign * len(posts))
+    for author_id, number in Tally(p.author_id for p in posts).items():
+        change(AUTHOR_POSTS, author_id, sign * number)
+    for group_id, number in Tally(p.group_id for p in posts).items():
+        change(GROUP_POSTS, group_id, sign * number)
+
+
+def comments_added(comments, sign=1):
+    for post_id, number in Tally(c.post_id for c in comments).items():
+        change(POST_COMMENTS, post_id, sign * number)
+
+
+def actual_counts():
+    """Настоящие значения всех счётчиков, посчитанные по таблицам."""
+    counts = {(POSTS, 0): Post.objects.count()}
+    grouped = (
+        (AUTHOR_POSTS, Post.objects.values_list('author_id')),
+        (GROUP_POSTS, Post.objects.filter(
+            group__isnull=False
+        ).values_list('group_id')),
+        (POST_COMMENTS, Comment.objects.values_list('post_id')),
+        (FOLLOWERS, Follow.objects.values_list('author_id')),
+    )
+    for name, queryset in grouped:
+        rows = queryset.order_by().annotate(number=Count('pk'))
+        for object_id, number in rows:
+            counts[(name, object_id)] = number
+    return counts
+
+
+def reconcile():
+    """Приводит счётчики к настоящим значениям.
+
+    Возвращает число исправленных записей.
+    """
+    actual = actual_counts()
+    fixed = 0
+    for counter in Counter.objects.all().iterator():
+        key = (counter.name, counter.object_id)
+        value = actual.pop(key, 0)
+        if counter.value != value:
+            counter.value = value
+            counter.save(update_fields=['value'])
+            fixed += 1
+    Counter.objects.bulk_create(
+        Counter(name=name, object_id=object_id, value=value)
+        for (name, object_id), value in actual.items()
+    )
+    return fixed + len(actual)
@@ -0,0 +1,71 @@
+"""ETag страниц для условных GET-запросов (декоратор etag).
+
+ETag страницы — хэш версий областей, от которых она зависит (см.
+caching.scope_versions), и того, что в ней зависит от зрителя:
+пользователь, его CSRF-cookie (токен в формах), параметры запроса и
+подписка на автора. Версии лежат в кэше, поэтому проверка неизменной
+страницы — один запрос по индексу, чтобы найти пост, автора или группу,
+и одно обращение к кэшу; ответ 304 без отрисовки шаблонов.
+
+Last-Modified не отдаётся: дата изменения не учитывает зрителя, и
+клиент, который прислал только If-Modified-Since, получил бы чужую
+страницу.
+"""
+import hashlib
+
+from django.conf import settings
+
+from . import caching, follows
+from .models import Group, Post, User
+
+
+def _etag(request, versions, *extra):
+    viewer = (
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        request.GET.urlencode(),
+    )
+    return hashlib.blake2b(
+        repr((versions, viewer, extra)).encode(), digest_size=12
+    ).hexdigest()
+
+
+def index(request):
+    return _etag(request, caching.feed_version())
+
+
+def group_posts(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug
+    ).values_list('pk', flat=True).first()
+    if group_id is None:
+        return None
+    return _etag(
+        request, caching.scope_versions([(caching.GROUP, group_id)])
+    )
+
+
+def profile(request, username):
+    author_id = User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True).first()
+    if author_id is None:
+        return None
+    return _etag(
+        request,
+        caching.scope_versions([(caching.AUTHOR, author_id)]),
+        follows.is_following(request.user, author_id),
+    )
+
+
+def post_detail(request, post_id):
+    post = Post.objects.filter(
+        pk=post_id
+    ).values_list('author_id', 'group_id', 'version').first()
+    if post is None:
+        return None
+    author_id, group_id, version = post
+    scopes = [(caching.POST, post_id), (caching.AUTHOR, author_id)]
+    if group_id is not None:
+        scopes.append((caching.GROUP, group_id))
+    return _etag(request, caching.scope_versions(scopes), version)
@@ -0,0 +1,203 @@
+"""Граф подписок: подписка и отписка одним запросом.
+
+Подписка — это INSERT ... SELECT, который сам находит авторов по
+username и пропускает уже существующие пары (insert с
+ignore_conflicts), отписка — DELETE с тем же подзапросом. Оба запроса
+возвращают через RETURNING только те пары, которые действительно
+вставили или удалили, и счётчик подписчиков и лента подписок меняются
+только для них. Поэтому два одновременных одинаковых запроса не
+создают дублей и не считают подписчика дважды.
+
+Списки имён обрабатываются пачками по BATCH_SIZE: подписка на 5000
+авторов — один INSERT, а счётчики и лента обновляются несколькими
+запросами на пачку, без сигналов на каждую подписку.
+
+Подписки пользователя кэшируются целиком: отсортированные id авторов
+упакованы в array('I') по 4 байта, и проверка «подписан ли» — двоичный
+поиск по ним, без запроса и без множества объектов int в памяти.
+Кэш сбрасывается после коммита любой подписки или отписки.
+"""
+import sqlite3
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import counters, timeline
+from .models import Follow, User
+
+BATCH_SIZE = 5000
+FOLLOWING_KEY = 'following:{}'
+FOLLOWING_TTL = 5 * 60
+# Подписки длиннее не кэшируются: проверка идёт запросом.
+FOLLOWING_CACHE_MAX = 100_000
+
+
+def _batches(values):
+    values = list(dict.fromkeys(values))
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def _name(model, field=None):
+    if field is None:
+        return connection.ops.quote_name(model._meta.db_table)
+    return connection.ops.quote_name(model._meta.get_field(field).column)
+
+
+def _supports_returning():
+    if connection.vendor == 'postgresql':
+        return True
+    return (
+        connection.vendor == 'sqlite'
+        and sqlite3.sqlite_version_info >= (3, 35)
+    )
+
+
+def _authors(usernames, user_id):
+    """Подзапрос id авторов по именам, кроме самого пользователя."""
+    placeholders = ', '.join(['%s'] * len(usernames))
+    return (
+        f'SELECT {_name(User, "id")} FROM {_name(User)} '
+        f'WHERE {_name(User, "username")} IN ({placeholders}) '
+        f'AND {_name(User, "id")} <> %s',
+        [*usernames, user_id],
+    )
+
+
+def _execute(sql, params, user_id, usernames):
+    """Выполняет запрос к подпискам и возвращает id затронутых
+    авторов. Без RETURNING (старый SQLite, MySQL) они вычисляются
+    сравнением подписок до и после запроса."""
+    returning = _supports_returning()
+    if returning:
+        sql += f' RETURNING {_name(Follow, "author")}'
+    else:
+        before = set(_followed(user_id, usernames))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning:
+            return [author_id for author_id, in cursor.fetchall()]
+    after = set(_followed(user_id, usernames))
+    return list(before ^ after)
+
+
+def _followed(user_id, usernames):
+    return Follow.objects.filter(
+        user_id=user_id, author__username__in=usernames
+    ).values_list('author_id', flat=True)
+
+
+def follow(user, usernames):
+    """Подписывает user на авторов с именами usernames. Себя и
+    несуществующие имена пропускает. Возвращает id авторов, подписка
+    на которых добавлена."""
+    ops = connection.ops
+    added = []
+    with transaction.atomic():
+        for batch in _batches(usernames):
+            authors, params = _authors(batch, user.pk)
+            sql = (
+                f'{ops.insert_statement(ignore_conflicts=True)} '
+                f'{_name(Follow)} '
+                f'({_name(Follow, "user")}, {_name(Follow, "author")}) '
+                f'SELECT %s, id FROM ({authors}) AS authors '
+                f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+            )
+            authors = _execute(sql, [user.pk, *params], user.pk, batch)
+            if authors:
+                counters.change_many(counters.FOLLOWERS, authors)
+                timeline.backfill_many(user.pk, authors)
+            added += authors
+        if added:
+            forget_following(user.pk)
+    return added
+
+
+def unfollow(user, usernames):
+    """Отписывает user от авторов с именами usernames. Возвращает id
+    авторов, подписка на которых удалена."""
+    removed = []
+    with transaction.atomic():
+        for batch in _batches(usernames):
+            authors, params = _authors(batch, user.pk)
+            sql = (
+                f'DELETE FROM {_name(Follow)} '
+                f'WHERE {_name(Follow, "user")} = %s '
+                f'AND {_name(Follow, "author")} IN ({authors})'
+            )
+            authors = _execute(sql, [user.pk, *params], user.pk, batch)
+            if authors:
+                counters.change_many(counters.FOLLOWERS, authors, -1)
+                timeline.prune_many(user.pk, authors)
+                timeline.refill(authors)
+            removed += authors
+        if removed:
+            forget_following(user.pk)
+    return removed
+
+
+class Following:
+    """Подписки пользователя: отсортированный массив id авторов."""
+
+    def __init__(self, author_ids):
+        self.author_ids = author_ids
+
+    def __contains__(self, author_id):
+        index = bisect_left(self.author_ids, author_id)
+        return (
+            index < len(self.author_ids)
+            and self.author_ids[index] == author_id
+        )
+
+    def __len__(self):
+        return len(self.author_ids)
+
+
+def _load_following(user_id):
+    key = FOLLOWING_KEY.format(user_id)
+    packed = cache.get(key)
+    if packed is not None:
+        author_ids = array('I')
+        author_ids.frombytes(packed)
+        return Following(author_ids)
+    author_ids = array('I', Follow.objects.filter(
+        user_id=user_id
+    ).order_by('author_id').values_list(
+        'author_id', flat=True
+    )[:FOLLOWING_CACHE_MAX + 1])
+    if len(author_ids) > FOLLOWING_CACHE_MAX:
+        return None
+    cache.add(key, author_ids.tobytes(), FOLLOWING_TTL)
+    return Following(author_ids)
+
+
+def following(user):
+    """Подписки пользователя или None, если их слишком много для
+    кэша. Загружаются один раз за запрос: запоминаются в user."""
+    if not user.is_authenticated:
+        return Following(array('I'))
+    if not hasattr(user, '_following'):
+        user._following = _load_following(user.pk)
+    return user._following
+
+
+def is_following(user, author_id):
+    if not user.is_authenticated or user.pk == author_id:
+        return False
+    authors = following(user)
+    if authors is None:
+        return Follow.objects.filter(
+            user=user, author_id=author_id
+        ).exists()
+    return author_id in authors
+
+
+def forget_following(user_id):
+    """Сбрасывает кэш подписок сразу и ещё раз после коммита: между
+    ними параллельный запрос мог положить в кэш подписки до изменения.
+    """
+    key = FOLLOWING_KEY.format(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
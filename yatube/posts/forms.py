@@ -1,4 +1,7 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
 from .models import Comment, Post
 
@@ -17,6 +20,38 @@ class PostForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, rejected_uploads=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejected_uploads = rejected_uploads or {}
+
+    def clean_image(self):
+        if 'image' in self.rejected_uploads:
+            raise forms.ValidationError(
+                'Файл больше %s' % filesizeformat(
+                    settings.POSTS_IMAGE_MAX_SIZE
+                )
+            )
+        data = self.cleaned_data['image']
+        if not isinstance(data, UploadedFile):
+            return data
+        # ImageField уже открыл картинку: Pillow прочитал только
+        # заголовок, пиксели не декодировались.
+        image = data.image
+        if image.format not in settings.POSTS_IMAGE_FORMATS:
+            raise forms.ValidationError(
+                'Поддерживаются форматы: %s'
+                % ', '.join(settings.POSTS_IMAGE_FORMATS)
+            )
+        width, height = image.size
+        if max(width, height) > settings.POSTS_IMAGE_MAX_SIDE:
+            raise forms.ValidationError(
+                'Сторона картинки не должна быть больше %s пикселей'
+                % settings.POSTS_IMAGE_MAX_SIDE
+            )
+        if width * height > settings.POSTS_IMAGE_MAX_PIXELS:
+            raise forms.ValidationError('Слишком большая картинка')
+        return data
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from posts import caching, cards
+from posts.models import Post
+from posts.utils import POSTS_NUMBER
+
+# Лента так, как её рисовали до posts.cards: include на каждую карточку.
+INCLUDE_LOOP = (
+    '{% for post in posts %}'
+    '{% include "includes/post.html" with show_profile_link=True '
+    'show_group_link=True %}'
+    '{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает цену карточки поста: шаблон includes/post.html '
+        'через include и быструю отрисовку posts.cards. Холодный кэш — '
+        'карточки рисуются, тёплый — берутся из кэша фрагментов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        posts = list(Post.objects.for_feed().order_by('-created')[
+            :options['pages'] * POSTS_NUMBER
+        ])
+        if not posts:
+            raise CommandError('Нет постов: заполните базу командой seed_data')
+        pages = [
+            posts[start:start + POSTS_NUMBER]
+            for start in range(0, len(posts), POSTS_NUMBER)
+        ]
+        template = engines['django'].from_string(INCLUDE_LOOP)
+        runs = (
+            ('шаблон', lambda page: template.render({'posts': page})),
+            ('posts.cards', lambda page: cards.render_cards(
+                page, show_profile_link=True, show_group_link=True
+            )),
+        )
+        loader = 'cached' if settings.TEMPLATE_CACHE else 'обычный'
+        self.stdout.write(f'Загрузчик шаблонов: {loader}')
+        results = {}
+        for warm in (False, True):
+            for title, render in runs:
+                timings = []
+                for _ in range(options['repeat']):
+                    for page in pages:
+                        self.forget(page)
+                        if warm:
+                            render(page)
+                        started = time.perf_counter()
+                        render(page)
+                        timings.append(
+                            (time.perf_counter() - started) / len(page)
+                        )
+                per_card = statistics.median(timings) * 1e6
+                results[title, warm] = per_card
+                self.stdout.write(
+                    f'{"тёплый" if warm else "холодный"} кэш, {title:12} '
+                    f'{per_card:8.1f} мкс на карточку'
+                )
+            template_cost, fast_cost = (
+                results[title, warm] for title, _ in runs
+            )
+            self.stdout.write(
+                f'  быстрее в {template_cost / fast_cost:.1f} раза'
+            )
+
+    def forget(self, page):
+        cache.delete_many([
+            caching.card_key(post.pk, post.version, True, True)
+            for post in page
+        ])
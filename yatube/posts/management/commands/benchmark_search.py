@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+from posts.utils import POSTS_NUMBER
+
+DEFAULT_QUERIES = ('пост', 'номер 4242', 'нет такого слова')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск по индексу с LIKE-поиском, как в админке: '
+        'первая страница и число найденных. Базу можно заполнить '
+        'командой seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Сначала пересобрать индекс',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            started = time.perf_counter()
+            posts, _ = search.rebuild()
+            self.stdout.write(
+                f'Индекс: {posts} постов за '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+        backend = 'fts' if search.use_fts() else 'index'
+        for query in options['queries']:
+            self.stdout.write(self.style.MIGRATE_HEADING(query))
+            for title, run in (('like', self.like), (backend, self.index)):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    found = run(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'  {title:6} найдено {found:8}  '
+                    f'медиана {statistics.median(timings):9.2f} мс  '
+                    f'максимум {max(timings):9.2f} мс'
+                )
+
+    def like(self, query):
+        posts = Post.objects.for_feed()
+        for word in query.split():
+            posts = posts.filter(text__icontains=word)
+        list(posts[:POSTS_NUMBER])
+        return posts.count()
+
+    def index(self, query):
+        results = search.search_posts(query)
+        list(results[:POSTS_NUMBER])
+        return results.count()
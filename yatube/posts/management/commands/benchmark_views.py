@@ -0,0 +1,245 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from posts import search, urls
+from posts.models import Follow, Group, Post, User
+
+# Эти адреса меняют данные или выгружают архив целиком, их не замеряем.
+UNSAFE = (
+    'post_create', 'add_comment', 'profile_follow', 'profile_unfollow',
+    'profile_export',
+)
+# Адреса со страничной пагинацией: для них замеряется и глубокая страница.
+PAGINATED = ('index', 'group_list', 'profile', 'follow_index', 'search')
+PERCENTILES = (50, 90, 95, 99)
+
+
+class QueryCounter:
+    """Считает запросы и их время через execute_wrapper.
+
+    CaptureQueriesContext тут не годится: он берёт срез
+    connection.queries, а этот журнал ограничен 9000 записей, и после
+    долгого прогона с DEBUG = True срез оказывается пустым.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def _percentile(timings, percent):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(timings)
+    rank = max(round(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку (перцентили), число и время SQL-запросов и '
+        'пиковую память каждого адреса posts.urls. Данные готовит '
+        'seed_data. Результат можно сохранить в JSON (--output) и '
+        'сравнить с сохранённым ранее (--compare).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--deep-page', type=int, default=50,
+            help='Номер страницы для замера глубокой пагинации',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument('--output', help='Куда записать JSON')
+        parser.add_argument('--compare', help='JSON прошлого замера')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Допустимый рост p50 и числа запросов, %%',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        post = Post.objects.annotate(
+            comments_number=Count('comments')
+        ).order_by('-comments_number', '-pk').first()
+        if post is None:
+            raise CommandError('Нет постов: заполните базу командой seed_data')
+        self.client = Client(HTTP_HOST=self.host())
+        viewer = self.viewer()
+        if viewer is not None:
+            self.client.force_login(viewer)
+        results = {}
+        for name, url in self.targets(post):
+            results[name] = self.measure(url)
+            self.report(name, results[name])
+        report = {'meta': self.meta(), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0].lstrip('.') if hosts else 'localhost'
+
+    def viewer(self):
+        """Пользователь с наибольшим числом подписок: его лента подписок
+        самая тяжёлая."""
+        follow = Follow.objects.values('user').annotate(
+            authors=Count('author')
+        ).order_by('-authors').first()
+        if follow is None:
+            return User.objects.first()
+        return User.objects.get(pk=follow['user'])
+
+    def targets(self, post):
+        """Имя замера и адрес для каждого безопасного адреса posts.urls.
+
+        Параметры берутся у самых тяжёлых объектов: самая большая
+        группа, самый плодовитый автор, самый обсуждаемый пост.
+        """
+        group = Group.objects.annotate(
+            posts_number=Count('posts')
+        ).order_by('-posts_number').first()
+        author = User.objects.annotate(
+            posts_number=Count('posts')
+        ).order_by('-posts_number').first()
+        values = {
+            'slug': group.slug if group else None,
+            'username': author.username,
+            'post_id': post.pk,
+        }
+        words = search.terms(post.text)
+        query = f'?q={words[0]}&' if words else '?'
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if name in UNSAFE:
+                continue
+            kwargs = {
+                key: values[key] for key in pattern.pattern.converters
+            }
+            if None in kwargs.values():
+                continue
+            url = reverse(f'{urls.app_name}:{name}', kwargs=kwargs)
+            prefix = query if name == 'search' else '?'
+            yield name, url + prefix.rstrip('?&')
+            if name in PAGINATED:
+                yield (
+                    f'{name} (page {self.options["deep_page"]})',
+                    f'{url}{prefix}page={self.options["deep_page"]}',
+                )
+
+    def request(self, url):
+        if self.options['cold']:
+            cache.clear()
+        return self.client.get(url)
+
+    def measure(self, url):
+        for _ in range(self.options['warmup']):
+            self.request(url)
+        timings = []
+        for _ in range(self.options['repeat']):
+            started = time.perf_counter()
+            response = self.request(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        # Запросы и память считаются отдельными прогонами: и то и другое
+        # замедляет ответ и исказило бы задержку.
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            self.request(url)
+        tracemalloc.start()
+        self.request(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result = {'url': url, 'status': response.status_code}
+        for percent in PERCENTILES:
+            result[f'p{percent}'] = round(_percentile(timings, percent), 3)
+        result.update(
+            mean=round(statistics.mean(timings), 3),
+            max=round(max(timings), 3),
+            queries=queries.count,
+            sql_ms=round(queries.seconds * 1000, 3),
+            memory_kb=round(peak / 1024, 1),
+            bytes=len(response.content),
+        )
+        return result
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:28} {result["status"]}  '
+            f'p50 {result["p50"]:8.2f}  p95 {result["p95"]:8.2f}  '
+            f'p99 {result["p99"]:8.2f} мс  '
+            f'запросов {result["queries"]:3}  '
+            f'SQL {result["sql_ms"]:7.2f} мс  '
+            f'память {result["memory_kb"]:8.1f} КБ'
+        )
+
+    def meta(self):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': settings.CACHES.get(
+                'metered', settings.CACHES['default']
+            )['BACKEND'],
+            'debug': settings.DEBUG,
+            'cold': self.options['cold'],
+            'repeat': self.options['repeat'],
+            'volumes': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+        }
+
+    def compare(self, path, results):
+        """Печатает изменения относительно прошлого замера и падает,
+        если p50 или число запросов выросли больше порога."""
+        with open(path) as file:
+            baseline = json.load(file)['results']
+        threshold = self.options['threshold']
+        regressions = []
+        self.stdout.write(self.style.MIGRATE_HEADING('Сравнение с ' + path))
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            changes = []
+            for metric in ('p50', 'queries'):
+                old, new = before[metric], result[metric]
+                delta = (new - old) / old * 100 if old else 0
+                changes.append(f'{metric} {old} -> {new} ({delta:+.0f}%)')
+                if delta > threshold:
+                    regressions.append(f'{name}: {metric}')
+            self.stdout.write(f'{name:28} ' + ', '.join(changes))
+        if regressions:
+            raise CommandError(
+                'Регрессия больше чем на %s%%: %s'
+                % (threshold, ', '.join(regressions))
+            )
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import seeding, timeline
+from posts.models import Follow, Group, Post
+from posts.utils import POSTS_NUMBER
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы запросов лент (EXPLAIN QUERY PLAN) и время их '
+        'выполнения. С --seed-posts сначала заполняет базу постами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-posts', type=int, default=0)
+        parser.add_argument('--authors', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['seed_posts']:
+            seeding.seed(
+                users=options['authors'],
+                groups=options['groups'],
+                posts=options['seed_posts'],
+                comments=100,
+                follows=options['authors'],
+                progress=self.stdout.write,
+            )
+        post = Post.objects.order_by('-created').first()
+        if post is None:
+            self.stderr.write('Нет постов: запустите с --seed-posts N')
+            return
+        group = Group.objects.first()
+        follow = Follow.objects.select_related('user').first()
+        for title, queryset in self.queries(post, group, follow):
+            self.explain(title, queryset[:POSTS_NUMBER])
+
+    def queries(self, post, group, follow):
+        yield 'index', Post.objects.for_feed()
+        yield 'profile', post.author.posts.for_feed()
+        if group is not None:
+            yield 'group_posts', group.posts.for_feed()
+        if follow is not None:
+            yield 'follow_index', timeline.feed(follow.user).for_feed()
+        yield 'comments', post.comments.select_related('author')
+        yield 'keyset', Post.objects.for_feed().filter(
+            created__lt=post.created
+        ).order_by('-created', '-pk')
+
+    def explain(self, title, queryset):
+        started = time.perf_counter()
+        list(queryset)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{title}: {elapsed:.2f} мс'
+        ))
+        self.stdout.write(queryset.explain())
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в каталог: '
+        'по файлу NDJSON или CSV на модель.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='ndjson'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        for name, model, columns in transfer.TABLES:
+            written = transfer.export_table(
+                directory, name, model, columns, options['format']
+            )
+            self.stdout.write(f'{name}: {written}')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Делает миниатюры картинок постов, у которых их ещё нет.'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('image', 'renditions')
+        names = {
+            post.image.name for post in posts.iterator()
+            if thumbnails.get_manifest(post) is None
+        }
+        for name in sorted(names):
+            thumbnails.generate(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(names)}'
+        ))
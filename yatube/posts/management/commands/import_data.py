@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает каталог, выгруженный export_data. Прерванная загрузка '
+        'при повторном запуске продолжается с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Не продолжать прерванную загрузку, а начать сначала',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        importer = transfer.Importer(
+            options['directory'],
+            batch_size=options['batch_size'],
+            restart=options['restart'],
+            progress=self.stdout.write,
+        )
+        total = importer.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total}, пропущено: {importer.skipped}, '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов и групп.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts, groups = search.rebuild()
+        backend = 'FTS5' if search.use_fts() else 'SearchEntry'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано ({backend}): постов {posts}, групп {groups}'
+        ))
@@ -0,0 +1,164 @@
+import random
+import re
+import time
+from collections import defaultdict
+from itertools import accumulate, zip_longest
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import Resolver404, resolve, reverse
+
+from posts import counters
+from posts.models import Comment, Counter, Group, Post, User
+
+# Адрес из строки журнала веб-сервера или просто путь.
+LOG_PATH = re.compile(r'"GET (\S+)|^(/\S*)')
+# Адреса с ETag (см. posts.etags).
+CONDITIONAL = (
+    'posts:index', 'posts:group_list', 'posts:profile', 'posts:post_detail'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Проигрывает GET-запросы посетителей, которые помнят ETag '
+        'страниц, вперемешку с новыми постами и комментариями, и '
+        'считает долю ответов 304 по адресам. Адреса берутся из '
+        'журнала (--log) или выбираются по Ципфу среди популярных. '
+        'Все изменения в конце откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--visitors', type=int, default=20)
+        parser.add_argument(
+            '--logged-in', type=float, default=0.5,
+            help='Доля посетителей, вошедших на сайт',
+        )
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.02,
+            help='Доля шагов, на которых пишется пост или комментарий',
+        )
+        parser.add_argument(
+            '--hot', type=int, default=50,
+            help='Сколько популярных постов, авторов и групп брать',
+        )
+        parser.add_argument('--log', help='Журнал с адресами запросов')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.posts = list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:options['hot']])
+        prolific = Counter.objects.filter(
+            name=counters.AUTHOR_POSTS
+        ).order_by('-value').values('object_id')[:options['hot']]
+        self.authors = list(User.objects.filter(pk__in=prolific))
+        if not self.posts or not self.authors:
+            raise CommandError('Нет постов: заполните базу командой seed_data')
+        urls = self.logged_urls() if options['log'] else self.hot_urls()
+        visitors = self.visitors()
+        stats = defaultdict(lambda: {'requests': 0, 'not_modified': 0,
+                                     'ms_200': 0, 'ms_304': 0})
+        with transaction.atomic():
+            for _ in range(options['requests']):
+                if self.rng.random() < options['write_ratio']:
+                    self.write()
+                    continue
+                client, etags = self.rng.choice(visitors)
+                url = next(urls)
+                headers = {}
+                if url in etags:
+                    headers['HTTP_IF_NONE_MATCH'] = etags[url]
+                started = time.perf_counter()
+                response = client.get(url, **headers)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.has_header('ETag'):
+                    etags[url] = response['ETag']
+                view = stats[resolve(url.split('?')[0]).view_name]
+                view['requests'] += 1
+                if response.status_code == 304:
+                    view['not_modified'] += 1
+                    view['ms_304'] += elapsed
+                else:
+                    view['ms_200'] += elapsed
+            transaction.set_rollback(True)
+        self.report(stats)
+
+    def hot_urls(self):
+        """Бесконечный поток адресов: k-й по популярности адрес
+        выбирается в k раз реже первого."""
+        hot = self.options['hot']
+        slugs = Group.objects.order_by('pk').values_list('slug', flat=True)
+        ranked = zip_longest(
+            [reverse('posts:post_detail', args=[pk]) for pk in self.posts],
+            [reverse('posts:profile', args=[author.username])
+             for author in self.authors],
+            [reverse('posts:group_list', args=[slug])
+             for slug in slugs[:hot]],
+        )
+        urls = [reverse('posts:index')] + [
+            url for urls in ranked for url in urls if url is not None
+        ]
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(urls) + 1)
+        ))
+        while True:
+            yield self.rng.choices(urls, cum_weights=weights)[0]
+
+    def logged_urls(self):
+        urls = []
+        with open(self.options['log']) as log:
+            for line in log:
+                match = LOG_PATH.search(line)
+                if not match:
+                    continue
+                url = match.group(1) or match.group(2)
+                try:
+                    resolve(url.split('?')[0])
+                except Resolver404:
+                    continue
+                urls.append(url)
+        if not urls:
+            raise CommandError('В журнале нет адресов сайта')
+        while True:
+            yield from urls
+
+    def visitors(self):
+        visitors = []
+        for _ in range(self.options['visitors']):
+            client = Client()
+            if self.rng.random() < self.options['logged_in']:
+                client.force_login(self.rng.choice(self.authors))
+            visitors.append((client, {}))
+        return visitors
+
+    def write(self):
+        author = self.rng.choice(self.authors)
+        if self.rng.random() < 0.5:
+            Post.objects.create(author=author, text='Новый пост')
+        else:
+            Comment.objects.create(
+                post_id=self.rng.choice(self.posts), author=author,
+                text='Новый комментарий',
+            )
+
+    def report(self, stats):
+        total = sum(view['requests'] for view in stats.values())
+        cached = sum(view['not_modified'] for view in stats.values())
+        for name, view in sorted(stats.items()):
+            requests, not_modified = view['requests'], view['not_modified']
+            full = requests - not_modified
+            self.stdout.write(
+                f'{name:24} запросов {requests:6}  '
+                f'304: {not_modified / requests:6.1%}  '
+                f'200 {view["ms_200"] / max(full, 1):7.2f} мс  '
+                f'304 {view["ms_304"] / max(not_modified, 1):7.2f} мс'
+                + ('' if name in CONDITIONAL else '  (без ETag)')
+            )
+        self.stdout.write(
+            f'Всего {total}, ответов 304: {cached / max(total, 1):.1%}'
+        )
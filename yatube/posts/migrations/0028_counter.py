@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Counter = apps.get_model('posts', 'Counter')
+    Post = apps.get_model('posts', 'Post')
+    counters = [Counter(name='posts', object_id=0, value=Post.objects.count())]
+    grouped = (
+        ('author_posts', Post.objects.values_list('author_id')),
+        ('group_posts', Post.objects.filter(
+            group__isnull=False).values_list('group_id')),
+        ('post_comments', Comment.objects.values_list('post_id')),
+    )
+    for name, queryset in grouped:
+        rows = queryset.order_by().annotate(number=models.Count('pk'))
+        counters.extend(
+            Counter(name=name, object_id=object_id, value=number)
+            for object_id, number in rows
+        )
+    Counter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0027_auto_20230222_1841'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, verbose_name='Счётчик')),
+                ('object_id', models.PositiveIntegerField(default=0, verbose_name='Объект')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счётчик',
+                'verbose_name_plural': 'Счётчики',
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ('-created',), 'verbose_name': 'Комментарий', 'verbose_name_plural': 'Комментарии'},
+        ),
+        migrations.AlterModelOptions(
+            name='follow',
+            options={'verbose_name': '', 'verbose_name_plural': ''},
+        ),
+        migrations.AlterModelOptions(
+            name='group',
+            options={'verbose_name': 'Группа'},
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='author',
+            field=models.ForeignKey(help_text='Вы можете подписаться на этого пользователя', on_delete=django.db.models.deletion.CASCADE, related_name='following', to=settings.AUTH_USER_MODEL, verbose_name='Подписка'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_user_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='counter',
+            constraint=models.UniqueConstraint(fields=('name', 'object_id'), name='unique_counter'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
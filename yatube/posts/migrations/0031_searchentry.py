@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts import search
+
+
+def create_search_index(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    connection = schema_editor.connection
+    search.create_fts_tables(connection)
+    search.write(
+        'post', Post.objects.values_list('pk', 'text').iterator(), connection
+    )
+    search.write('group', (
+        (pk, f'{title} {description}')
+        for pk, title, description in Group.objects.values_list(
+            'pk', 'title', 'description')
+    ), connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_fts_tables(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0030_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Терм')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='Число вхождений')),
+                ('group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Group', verbose_name='Группа')),
+                ('post', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Записи поискового индекса',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['term'], name='searchentry_term_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
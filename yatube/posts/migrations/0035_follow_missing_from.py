@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0034_timeline_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='missing_from',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Нет в ленте с даты'),
+        ),
+        migrations.AddField(
+            model_name='follow',
+            name='missing_from_post',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Нет в ленте с поста'),
+        ),
+    ]
@@ -2,10 +2,23 @@ from django.db import models
 
 from django.contrib.auth import get_user_model
 
-from core.models import CreatedModel
+from core.models import VersionedModel
 
 User = get_user_model()
 ADMIN_NUMBER_OF_CHARACTERS = 15
+# Поля, которые нужны для отрисовки карточки поста в ленте.
+FEED_FIELDS = (
+    'text',
+    'created',
+    'image',
+    'renditions',
+    'version',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__title',
+    'group__slug',
+)
 
 
 class Group(models.Model):
@@ -31,7 +44,23 @@ class Group(models.Model):
         return self.title
 
 
-class Post(CreatedModel):
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним запросом,
+        только колонки, которые нужны карточке поста."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .caching import bump_feed_version
+        from .counters import posts_added
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if not kwargs.get('ignore_conflicts'):
+            posts_added(objs)
+        bump_feed_version()
+        return objs
+
+
+class Post(VersionedModel):
     text = models.TextField(
         help_text='Текст не должен быть длиннее 700 символов',
         verbose_name='Текст'
@@ -55,17 +84,46 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    # Манифест готовых миниатюр картинки в JSON (см. thumbnails);
+    # пустая строка — миниатюры ещё не готовы.
+    renditions = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Миниатюры',
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы повторяют фильтры и сортировку лент: главной,
+        # профиля, группы и курсорной пагинации по (created, id).
+        indexes = [
+            models.Index(fields=['-created', '-id'],
+                         name='post_created_idx'),
+            models.Index(fields=['author', '-created'],
+                         name='post_author_created_idx'),
+            models.Index(fields=['group', '-created'],
+                         name='post_group_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:ADMIN_NUMBER_OF_CHARACTERS]
 
 
-class Comment(CreatedModel):
+class CommentQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        from .counters import comments_added
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if not kwargs.get('ignore_conflicts'):
+            comments_added(objs)
+        return objs
+
+
+class Comment(VersionedModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -84,10 +142,16 @@ class Comment(CreatedModel):
         verbose_name='Текст'
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -104,6 +168,19 @@ class Follow(models.Model):
         verbose_name='Подписка',
         help_text='Вы можете подписаться на этого пользователя',
     )
+    # Ключ (created, id) самого нового поста автора, которого нет в
+    # ленте подписчика; его и более старые посты лента читает напрямую
+    # (см. timeline).
+    missing_from = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Нет в ленте с даты',
+    )
+    missing_from_post = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Нет в ленте с поста',
+    )
 
     class Meta:
         verbose_name = ''
@@ -112,3 +189,102 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_user_author')
         ]
+
+
+class Counter(models.Model):
+    """Денормализованный счётчик: число постов автора, группы, сайта,
+    комментариев поста и подписчиков автора. Обновляется сигналами,
+    сверяется командой reconcile_counters."""
+    name = models.CharField(
+        max_length=32,
+        verbose_name='Счётчик',
+    )
+    object_id = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Объект',
+    )
+    value = models.IntegerField(
+        default=0,
+        verbose_name='Значение',
+    )
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'object_id'],
+                                    name='unique_counter')
+        ]
+
+    def __str__(self):
+        return f'{self.name}:{self.object_id}={self.value}'
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост, разосланный подписчику
+    при публикации (fan-out-on-write)."""
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+    )
+    created = models.DateTimeField(
+        'Дата создания поста',
+        null=True,
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post')
+        ]
+        # Страница ленты читается по индексу целиком, включая
+        # порядок равных дат по посту.
+        indexes = [
+            models.Index(fields=['user', '-created', '-post'],
+                         name='timeline_user_feed_idx')
+        ]
+
+
+class SearchEntry(models.Model):
+    """Запись обратного индекса поиска: терм и пост или группа, где он
+    встречается. Используется, когда в базе нет SQLite FTS5."""
+    term = models.CharField(
+        max_length=64,
+        verbose_name='Терм',
+    )
+    post = models.ForeignKey(
+        Post,
+        null=True,
+        related_name='search_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+    )
+    group = models.ForeignKey(
+        Group,
+        null=True,
+        related_name='search_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Группа',
+    )
+    count = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Число вхождений',
+    )
+
+    class Meta:
+        verbose_name = 'Запись поискового индекса'
+        verbose_name_plural = 'Записи поискового индекса'
+        indexes = [
+            models.Index(fields=['term'], name='searchentry_term_idx')
+        ]
@@ -0,0 +1,326 @@
+"""Полнотекстовый поиск по постам и группам.
+
+Текст разбивается на термы функцией terms(): слова в нижнем регистре,
+с «ё», заменённой на «е», и сведённые к основе русским стеммером.
+В индекс попадают уже основы, поэтому «кошки» находит «кошкам», а оба
+бэкенда ищут одинаково:
+
+* fts — виртуальные таблицы SQLite FTS5 (posts_post_fts,
+  posts_group_fts), rowid — id поста или группы, ранжирование bm25;
+* index — обратный индекс в таблице SearchEntry (терм, пост или
+  группа, число вхождений) с ранжированием tf-idf в Python. Работает
+  на любой базе и используется, когда FTS5 нет.
+
+Индекс обновляется сигналами при сохранении и удалении постов и
+групп. Посты из bulk_create в SQLite не получают id, поэтому после
+массовой загрузки нужна команда rebuild_search_index.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db import connection as default_connection
+
+from . import counters
+from .stemmer import stem
+from .models import Group, Post, SearchEntry
+
+TERM_RE = re.compile(r'[^\W_]+')
+TERM_MAX_LENGTH = 64
+BATCH_SIZE = 1000
+# При большем числе совпадений сортировка по bm25 обходит их все и
+# почти ничего не даёт, поэтому такие результаты идут от новых к старым.
+RANKED_MATCHES_LIMIT = 10000
+FTS_TABLES = {
+    'post': 'posts_post_fts',
+    'group': 'posts_group_fts',
+}
+ENTRY_TABLE = 'posts_searchentry'
+
+_fts_available = {}
+
+
+def terms(text):
+    """Основы слов текста в порядке появления."""
+    return [
+        stem(word)[:TERM_MAX_LENGTH] for word in TERM_RE.findall(text)
+    ]
+
+
+def use_fts(connection=None):
+    connection = connection or default_connection
+    if settings.POSTS_SEARCH_BACKEND != 'fts':
+        return False
+    if connection.vendor != 'sqlite':
+        return False
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_available:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        _fts_available[key] = FTS_TABLES['post'] in tables
+    return _fts_available[key]
+
+
+def create_fts_tables(connection):
+    """Создаёт таблицы FTS5, если SQLite собран с ними."""
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            for table in FTS_TABLES.values():
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} '
+                    'USING fts5(body)'
+                )
+    except OperationalError:
+        return False
+    finally:
+        _fts_available.clear()
+    return True
+
+
+def drop_fts_tables(connection):
+    with connection.cursor() as cursor:
+        for table in FTS_TABLES.values():
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    _fts_available.clear()
+
+
+def forget(kind, ids, connection=None):
+    """Убирает из индекса посты или группы (kind — 'post'/'group')."""
+    connection = connection or default_connection
+    ids = [(pk,) for pk in ids]
+    if not ids:
+        return
+    with connection.cursor() as cursor:
+        if use_fts(connection):
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLES[kind]} WHERE rowid = %s', ids
+            )
+        else:
+            cursor.executemany(
+                f'DELETE FROM {ENTRY_TABLE} WHERE {kind}_id = %s', ids
+            )
+
+
+def write(kind, rows, connection=None, replace=True):
+    """Индексирует пары (id, текст), заменяя прежние записи.
+
+    replace=False — индекс заведомо пуст и удалять нечего.
+    """
+    connection = connection or default_connection
+    fts = use_fts(connection)
+    batch = []
+    for pk, text in rows:
+        batch.append((pk, terms(text)))
+        if len(batch) >= BATCH_SIZE:
+            _write_batch(kind, batch, fts, connection, replace)
+            batch = []
+    if batch:
+        _write_batch(kind, batch, fts, connection, replace)
+
+
+def _write_batch(kind, batch, fts, connection, replace):
+    if replace:
+        forget(kind, [pk for pk, _ in batch], connection)
+    with connection.cursor() as cursor:
+        if fts:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLES[kind]} (rowid, body) '
+                'VALUES (%s, %s)',
+                [(pk, ' '.join(words)) for pk, words in batch],
+            )
+            return
+        cursor.executemany(
+            f'INSERT INTO {ENTRY_TABLE} (term, {kind}_id, count) '
+            'VALUES (%s, %s, %s)',
+            [
+                (term, pk, count)
+                for pk, words in batch
+                for term, count in Counter(words).items()
+            ],
+        )
+
+
+def index_posts(posts):
+    write('post', ((post.pk, post.text) for post in posts))
+
+
+def index_groups(groups):
+    write('group', (
+        (group.pk, f'{group.title} {group.description}')
+        for group in groups
+    ))
+
+
+def clear(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if use_fts(connection):
+            for table in FTS_TABLES.values():
+                cursor.execute(f'DELETE FROM {table}')
+        else:
+            cursor.execute(f'DELETE FROM {ENTRY_TABLE}')
+
+
+def rebuild(connection=None):
+    """Заново строит индекс активного бэкенда по всем постам и группам.
+
+    Возвращает число проиндексированных постов и групп.
+    """
+    connection = connection or default_connection
+    posts = Post.objects.order_by('pk').values_list('pk', 'text')
+    groups = Group.objects.order_by().values_list(
+        'pk', 'title', 'description'
+    )
+    with transaction.atomic(using=connection.alias):
+        clear(connection)
+        write(
+            'post', posts.iterator(chunk_size=BATCH_SIZE), connection,
+            replace=False,
+        )
+        write('group', (
+            (pk, f'{title} {description}')
+            for pk, title, description in groups
+        ), connection, replace=False)
+    return posts.count(), groups.count()
+
+
+def _fts_query(words):
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def _fts_ids(kind, words, limit=None, offset=0, ranked=True):
+    table = FTS_TABLES[kind]
+    sql = (
+        f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY '
+        + ('rank, rowid DESC' if ranked else 'rowid DESC')
+    )
+    params = [_fts_query(words)]
+    if limit is not None:
+        sql += ' LIMIT %s OFFSET %s'
+        params += [limit, offset]
+    with default_connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [pk for pk, in cursor.fetchall()]
+
+
+def _fts_count(kind, words):
+    table = FTS_TABLES[kind]
+    with default_connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT count(*) FROM {table} WHERE {table} MATCH %s',
+            [_fts_query(words)],
+        )
+        return cursor.fetchone()[0]
+
+
+def _index_ids(kind, words, total):
+    """Id с каждым из термов по убыванию tf-idf."""
+    postings = SearchEntry.objects.filter(
+        term__in=words, **{f'{kind}__isnull': False}
+    ).values_list('term', f'{kind}_id', 'count')
+    frequencies = defaultdict(dict)
+    for term, pk, count in postings.iterator(chunk_size=BATCH_SIZE):
+        frequencies[term][pk] = count
+    if len(frequencies) < len(words):
+        return []
+    found = set.intersection(*(set(ids) for ids in frequencies.values()))
+    scores = dict.fromkeys(found, 0)
+    for ids in frequencies.values():
+        idf = math.log(1 + total / len(ids))
+        for pk in found:
+            scores[pk] += ids[pk] * idf
+    return sorted(found, key=lambda pk: (-scores[pk], -pk))
+
+
+class SearchResults:
+    """Найденные посты в порядке релевантности.
+
+    Ведёт себя как последовательность для Paginator. С FTS count() и
+    каждый срез — отдельные запросы за одну страницу, с индексом в
+    таблице ранжированный список id считается один раз.
+    """
+
+    def __init__(self, query):
+        self.words = list(dict.fromkeys(terms(query)))
+        self.fts = use_fts()
+        self._count = None
+        self._ids = None
+
+    def _all_ids(self):
+        if self._ids is None:
+            self._ids = _index_ids(
+                'post', self.words, counters.get_count(counters.POSTS)
+            )
+        return self._ids
+
+    def count(self):
+        if self._count is None:
+            if not self.words:
+                self._count = 0
+            elif self.fts:
+                self._count = _fts_count('post', self.words)
+            else:
+                self._count = len(self._all_ids())
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if not self.words:
+            return []
+        if self.fts:
+            start = key.start or 0
+            stop = self.count() if key.stop is None else key.stop
+            ids = _fts_ids(
+                'post', self.words, max(stop - start, 0), start,
+                ranked=self.count() <= RANKED_MATCHES_LIMIT,
+            )
+        else:
+            ids = self._all_ids()[key]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query):
+    return SearchResults(query)
+
+
+def filter_posts(queryset, query):
+    """Посты queryset, где есть все слова запроса (для админки)."""
+    words = list(dict.fromkeys(terms(query)))
+    if not words:
+        return queryset
+    if use_fts():
+        table = FTS_TABLES['post']
+        return queryset.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid FROM {table} '
+                f'WHERE {table} MATCH %s)'
+            ],
+            params=[_fts_query(words)],
+        )
+    for word in words:
+        queryset = queryset.filter(pk__in=SearchEntry.objects.filter(
+            term=word, post__isnull=False
+        ).values('post_id'))
+    return queryset
+
+
+def search_groups(query, limit=5):
+    words = list(dict.fromkeys(terms(query)))
+    if not words:
+        return []
+    if use_fts():
+        ids = _fts_ids('group', words, limit)
+    else:
+        ids = _index_ids('group', words, Group.objects.count())[:limit]
+    groups = Group.objects.in_bulk(ids)
+    return [groups[pk] for pk in ids if pk in groups]
@@ -0,0 +1,183 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Объёмы задаются параметрами, а все случайные выборы идут от одного
+seed, поэтому один и тот же вызов даёт одни и те же данные. Тексты
+собираются из заранее сгенерированных Faker предложений: вызывать
+Faker на каждый из миллиона постов слишком долго. Популярность авторов
+распределена по Ципфу: немногие авторы пишут большую часть постов и
+собирают большую часть подписчиков. Посты равномерно распределены по
+последним DAYS дням, id растут вместе с датой.
+"""
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from . import transfer
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 10000
+SENTENCES = 2000
+DAYS = 365
+# Доля постов без группы.
+UNGROUPED = 0.3
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _db_now():
+    now = timezone.now()
+    if settings.USE_TZ:
+        now = timezone.make_naive(now, connection.timezone)
+    return now
+
+
+def _zipf_weights(number):
+    """Накопленные веса для rng.choices: k-й по популярности
+    выбирается в k раз реже первого."""
+    return list(accumulate(1 / rank for rank in range(1, number + 1)))
+
+
+def _in_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    def __init__(self, seed=0, progress=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(seed)
+        self.progress = progress or (lambda message: None)
+        self.sentences = [
+            self.faker.sentence(nb_words=self.rng.randint(3, 12))
+            for _ in range(SENTENCES)
+        ]
+        self.adapt = connection.ops.adapt_datetimefield_value
+
+    def text(self, sentences):
+        return ' '.join(self.rng.choices(self.sentences, k=sentences))
+
+    def users(self, number):
+        """Создаёт пользователей (повторный запуск с тем же seed их
+        находит) и возвращает их id по убыванию популярности."""
+        password = make_password(None)
+        names = [f'{self.faker.user_name()}_{self.seed}_{i}'
+                 for i in range(number)]
+        ids = {}
+        for batch in _in_batches(names):
+            User.objects.bulk_create(
+                (User(username=name, password=password,
+                      first_name=self.faker.first_name(),
+                      last_name=self.faker.last_name())
+                 for name in batch),
+                ignore_conflicts=True,
+            )
+            ids.update(User.objects.filter(
+                username__in=batch
+            ).values_list('username', 'pk'))
+        return [ids[name] for name in names]
+
+    def groups(self, number):
+        slugs = [f'seed-{self.seed}-{i}' for i in range(number)]
+        Group.objects.bulk_create(
+            (Group(slug=slug, title=self.faker.catch_phrase()[:200],
+                   description=self.faker.paragraph())
+             for slug in slugs),
+            ignore_conflicts=True,
+        )
+        ids = dict(Group.objects.filter(
+            slug__in=slugs
+        ).values_list('slug', 'pk'))
+        return [ids[slug] for slug in slugs]
+
+    def posts(self, number, authors, groups):
+        """Вставляет посты; возвращает диапазон их id."""
+        first = _next_id(Post)
+        weights = _zipf_weights(len(authors))
+        step = timedelta(days=DAYS) / max(number, 1)
+        start = _db_now() - timedelta(days=DAYS)
+        rows = (
+            (
+                first + i,
+                self.rng.choices(authors, cum_weights=weights)[0],
+                None if not groups or self.rng.random() < UNGROUPED
+                else self.rng.choice(groups),
+                self.text(self.rng.randint(1, 6)),
+                self.adapt(start + step * i),
+                '',
+            )
+            for i in range(number)
+        )
+        self.insert(Post, transfer.INSERT_FIELDS['posts'], rows, number)
+        return range(first, first + number)
+
+    def comments(self, number, posts, authors):
+        first = _next_id(Comment)
+        now = _db_now()
+        rows = (
+            (
+                first + i,
+                self.rng.choice(posts),
+                self.rng.choice(authors),
+                self.text(1),
+                self.adapt(now - timedelta(
+                    seconds=self.rng.randrange(DAYS * 86400)
+                )),
+            )
+            for i in range(number)
+        )
+        self.insert(
+            Comment, transfer.INSERT_FIELDS['comments'], rows, number
+        )
+
+    def follows(self, number, users):
+        weights = _zipf_weights(len(users))
+        pairs = set()
+        # Пар не больше, чем возможно без подписки на себя.
+        number = min(number, len(users) * (len(users) - 1))
+        while len(pairs) < number:
+            user = self.rng.choice(users)
+            author = self.rng.choices(users, cum_weights=weights)[0]
+            if user != author:
+                pairs.add((user, author))
+        self.insert(
+            Follow, transfer.INSERT_FIELDS['follows'], sorted(pairs), number
+        )
+
+    def insert(self, model, fields, rows, total):
+        done = 0
+        for batch in _in_batches(rows):
+            with transaction.atomic():
+                transfer.insert_rows(model, fields, batch)
+            done += len(batch)
+            self.progress(f'{model._meta.model_name}: {done}/{total}')
+
+
+def seed(users=100, groups=10, posts=10000, comments=1000, follows=1000,
+         seed=0, progress=None):
+    """Заполняет базу и пересчитывает счётчики, ленты и поиск."""
+    seeder = Seeder(seed, progress)
+    user_ids = seeder.users(users)
+    group_ids = seeder.groups(groups)
+    post_ids = seeder.posts(posts, user_ids, group_ids)
+    if post_ids:
+        seeder.comments(comments, post_ids, user_ids)
+    seeder.follows(follows, user_ids)
+    seeder.progress('Пересчёт счётчиков, лент и поискового индекса')
+    transfer.rebuild_derived()
@@ -0,0 +1,186 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import caching, counters, follows, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, User
+
+# Поля пользователя, которые видны на карточках и страницах постов.
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_owners(sender, instance, raw, **kwargs):
+    """Запоминает автора и группу поста до редактирования."""
+    if raw or instance._state.adding:
+        return
+    instance._counted_owners = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('author_id', 'group_id').first()
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.posts_added([instance])
+        timeline.fan_out(instance)
+        return
+    owners = getattr(instance, '_counted_owners', None)
+    if owners is None:
+        return
+    author_id, group_id = owners
+    if author_id != instance.author_id:
+        counters.change(counters.AUTHOR_POSTS, author_id, -1)
+        counters.change(counters.AUTHOR_POSTS, instance.author_id)
+    if group_id != instance.group_id:
+        counters.change(counters.GROUP_POSTS, group_id, -1)
+        counters.change(counters.GROUP_POSTS, instance.group_id)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.posts_added([instance], sign=-1)
+    counters.forget(counters.POST_COMMENTS, instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.comments_added([instance])
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.comments_added([instance], sign=-1)
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_counter(sender, instance, **kwargs):
+    # Посты удалённой группы остаются без группы (SET_NULL)
+    # без сигналов, поэтому счётчик группы просто удаляется.
+    counters.forget(counters.GROUP_POSTS, instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.change(counters.FOLLOWERS, instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+        follows.forget_following(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change(counters.FOLLOWERS, instance.author_id, -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.refill([instance.author_id])
+    follows.forget_following(instance.user_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def forget_cached_post(sender, instance, raw=False, signal=None,
+                       **kwargs):
+    if raw:
+        return
+    version = instance.version
+    if signal is post_save and not kwargs.get('created'):
+        # Карточки остались под номером до правки.
+        version = instance._version_before
+    caching.forget_cards([(instance.pk, version)])
+    caching.bump_feed_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def mark_post_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    authors = {instance.author_id}
+    groups = {instance.group_id}
+    owners = getattr(instance, '_counted_owners', None)
+    if owners is not None:
+        author_id, group_id = owners
+        authors.add(author_id)
+        groups.add(group_id)
+    caching.bump_scopes(
+        [(caching.POST, instance.pk)]
+        + [(caching.AUTHOR, author_id) for author_id in authors]
+        + [(caching.GROUP, group_id) for group_id in groups]
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_scope(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump_scopes([(caching.POST, instance.post_id)])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def forget_cached_group(sender, instance, created=False, raw=False,
+                        **kwargs):
+    if created or raw:
+        return
+    posts = list(instance.posts.values_list('pk', 'version', 'author_id'))
+    caching.forget_cards(post[:2] for post in posts)
+    caching.bump_feed_version()
+    # Название группы есть на карточках в профилях её авторов.
+    caching.bump_scopes(
+        [(caching.GROUP, instance.pk)]
+        + [(caching.AUTHOR, author_id) for *_, author_id in posts]
+    )
+
+
+@receiver(post_save, sender=User)
+def forget_cached_author(sender, instance, created, raw, update_fields,
+                         **kwargs):
+    """Имя автора есть на его карточках во всех лентах и на страницах
+    его постов. Вход (правка одного last_login) кэш не трогает."""
+    if created or raw or (
+            update_fields is not None
+            and not CARD_USER_FIELDS & set(update_fields)):
+        return
+    posts = list(instance.posts.values_list('pk', 'version', 'group_id'))
+    caching.forget_cards(post[:2] for post in posts)
+    caching.bump_feed_version()
+    # Профиль и страницы постов зависят от области автора, группы —
+    # от своих областей.
+    caching.bump_scopes(
+        [(caching.AUTHOR, instance.pk)]
+        + [(caching.GROUP, group_id) for *_, group_id in posts]
+    )
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw, **kwargs):
+    name = instance.image.name
+    if raw or not name or thumbnails.get_manifest(instance) is not None:
+        return
+    thumbnails.schedule(name)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw, **kwargs):
+    if not raw:
+        search.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.forget('post', [instance.pk])
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, raw, **kwargs):
+    if not raw:
+        search.index_groups([instance])
+
+
+@receiver(post_delete, sender=Group)
+def unindex_group(sender, instance, **kwargs):
+    search.forget('group', [instance.pk])
@@ -0,0 +1,110 @@
+"""Стеммер русского языка по алгоритму Snowball (Портер).
+
+Окончания отрезаются только в области RV — после первой гласной слова,
+словообразовательный суффикс -ость — только в области R2. Все
+регулярные выражения компилируются при импорте, а результаты stem()
+запоминаются: в текстах постов слова сильно повторяются.
+Описание алгоритма: https://snowballstem.org/algorithms/russian/stemmer.html
+"""
+import re
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+STEM_CACHE_SIZE = 100_000
+
+
+def _ending(*groups, after_a=()):
+    """Окончание в конце слова; after_a — только после «а» или «я»."""
+    variants = '|'.join(groups)
+    if after_a:
+        variants += '|(?<=[ая])(?:%s)' % '|'.join(after_a)
+    return '(?:%s)' % variants
+
+
+PERFECTIVE_GERUND = re.compile(_ending(
+    'ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв',
+    after_a=('вшись', 'вши', 'в'),
+) + '$')
+REFLEXIVE = re.compile('с[яь]$')
+ADJECTIVE = _ending(
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое',
+    'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую',
+    'юю', 'ая', 'яя', 'ою', 'ею',
+)
+PARTICIPLE = _ending(
+    'ивш', 'ывш', 'ующ', after_a=('ем', 'нн', 'вш', 'ющ', 'щ')
+)
+ADJECTIVAL = re.compile(f'{PARTICIPLE}?{ADJECTIVE}$')
+VERB = re.compile(_ending(
+    'ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло',
+    'ено', 'ует', 'уют', 'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил',
+    'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю',
+    after_a=(
+        'ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н',
+    ),
+) + '$')
+NOUN = re.compile(_ending(
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие',
+    'ье', 'еи', 'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах',
+    'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы',
+    'ь', 'ю', 'я',
+) + '$')
+DERIVATIONAL = re.compile('ость?$')
+SUPERLATIVE = re.compile('ейше?$')
+REGION = re.compile(f'[{VOWELS}][^{VOWELS}]')
+
+
+def _regions(word):
+    """Начала областей RV и R2."""
+    rv = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS),
+        len(word),
+    )
+    r1 = r2 = len(word)
+    match = REGION.search(word)
+    if match:
+        r1 = match.end()
+        match = REGION.search(word, r1)
+        if match:
+            r2 = match.end()
+    return rv, r2
+
+
+def _cut(pattern, word, start):
+    """Отрезает окончание, если оно целиком лежит не левее start."""
+    match = pattern.search(word, start)
+    if match is None:
+        return word, False
+    return word[:match.start()], True
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word):
+    """Основа слова в нижнем регистре, с «ё», заменённой на «е»."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+    prefix, word = word[:rv], word[rv:]
+    r2 = max(r2 - rv, 0)
+
+    word, found = _cut(PERFECTIVE_GERUND, word, 0)
+    if not found:
+        word, _ = _cut(REFLEXIVE, word, 0)
+        for pattern in (ADJECTIVAL, VERB, NOUN):
+            word, found = _cut(pattern, word, 0)
+            if found:
+                break
+    if word.endswith('и'):
+        word = word[:-1]
+    word, _ = _cut(DERIVATIONAL, word, r2)
+    if word.endswith('нн'):
+        word = word[:-1]
+    else:
+        word, found = _cut(SUPERLATIVE, word, 0)
+        if found and word.endswith('нн'):
+            word = word[:-1]
+        elif not found and word.endswith('ь'):
+            word = word[:-1]
+    return prefix + word
@@ -0,0 +1,46 @@
+from django import template
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from posts import cards
+
+register = template.Library()
+
+# Сколько соседних номеров страниц показывать по обе стороны текущей.
+PAGE_WINDOW = 4
+
+
+@register.filter
+def post_cards(posts, links=''):
+    """Готовые карточки постов ленты для цикла for. В links через
+    запятую — ссылки под карточкой: profile, group.
+
+    С POSTS_FAST_CARDS карточки собирает posts.cards, иначе каждая
+    рисуется шаблоном includes/post.html.
+    """
+    links = links.split(',')
+    show_profile_link = 'profile' in links
+    show_group_link = 'group' in links
+    if settings.POSTS_FAST_CARDS:
+        return cards.render_cards(posts, show_profile_link, show_group_link)
+    card = get_template('includes/post.html')
+    return [
+        mark_safe(card.render({
+            'post': post,
+            'show_profile_link': show_profile_link,
+            'show_group_link': show_group_link,
+        }))
+        for post in posts
+    ]
+
+
+@register.filter
+def page_window(page):
+    """Номера страниц рядом с текущей: весь page_range на ленте
+    в сотню тысяч страниц рисовался секундами."""
+    last = page.paginator.num_pages
+    return range(
+        max(page.number - PAGE_WINDOW, 1),
+        min(page.number + PAGE_WINDOW, last) + 1,
+    )
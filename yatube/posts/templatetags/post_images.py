@@ -0,0 +1,25 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+def _manifest(image):
+    """Манифест миниатюр поста; пока его нет — исходный файл."""
+    manifest = thumbnails.get_manifest(image.instance)
+    if manifest is None:
+        return {'card': {'url': image.url}}
+    return manifest
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(image):
+    """Картинка поста: WebP и JPEG разных ширин через srcset."""
+    if not image:
+        return {}
+    manifest = _manifest(image)
+    return {
+        'card': manifest.get('card'),
+        'srcset': manifest.get('srcset', {}),
+    }
@@ -0,0 +1,181 @@
+import base64
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import api
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import COMMENTS_NUMBER, POSTS_NUMBER
+
+POSTS_TOTAL = 13
+
+
+def load(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return json.loads(response.content)
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='api_author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='api-group', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(POSTS_TOTAL)
+        )
+        cls.post = Post.objects.create(author=cls.reader, text='Чужой')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Ком {i}')
+            for i in range(COMMENTS_NUMBER + 5)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def get(self, name, query='', **kwargs):
+        return self.client.get(reverse(f'posts:{name}', kwargs=kwargs)
+                               + query)
+
+    def walk(self, name, query='', **kwargs):
+        """Все записи ленты, по курсорам от первой страницы."""
+        items = []
+        cursor = ''
+        while True:
+            data = load(self.get(name, f'?cursor={cursor}{query}',
+                                 **kwargs))
+            items += data['results']
+            cursor = data['next_cursor']
+            if cursor is None:
+                return items
+
+    def test_index_default_fields(self):
+        response = self.get('api_index')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = load(response)
+        self.assertEqual(len(data['results']), POSTS_NUMBER)
+        first = data['results'][0]
+        self.assertEqual(list(first), list(api.POST_DEFAULT))
+        self.assertEqual(first['text'], 'Чужой')
+        self.assertEqual(data['results'][1]['author_name'], 'Лев Толстой')
+        self.assertEqual(data['results'][1]['group'], self.group.slug)
+
+    def test_cursor_walks_whole_feed(self):
+        ids = [item['id'] for item in self.walk('api_index')]
+        self.assertEqual(ids, list(
+            Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True
+            )
+        ))
+
+    def test_fields_select_columns_and_joins(self):
+        """fields выбирает поля ответа и не делает лишних JOIN"""
+        with CaptureQueriesContext(connection) as queries:
+            data = load(self.get('api_index', '?fields=id,text&limit=2'))
+        self.assertEqual(
+            [list(item) for item in data['results']], [['id', 'text']] * 2
+        )
+        posts_sql = [
+            query['sql'] for query in queries
+            if 'posts_post' in query['sql']
+        ]
+        self.assertTrue(posts_sql)
+        self.assertNotIn('JOIN', posts_sql[-1])
+
+    def test_cursor_id_out_of_range_first_page(self):
+        cursor = base64.urlsafe_b64encode(
+            b'n|2020-01-01T00:00:00+00:00|99999999999999999999999'
+        ).decode()
+        response = self.get('api_index', f'?cursor={cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(load(response)['results']), POSTS_NUMBER)
+
+    def test_unknown_field_bad_request(self):
+        response = self.get('api_index', '?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', load(response)['error'])
+
+    def test_large_page_streams(self):
+        response = self.get('api_index', f'?limit={api.STREAM_LIMIT + 1}')
+        self.assertTrue(response.streaming)
+        data = load(response)
+        self.assertEqual(len(data['results']), POSTS_TOTAL + 1)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_group_and_profile(self):
+        data = load(self.get('api_group_list', slug=self.group.slug))
+        self.assertEqual(data['group'], {
+            'slug': 'api-group', 'title': 'Группа',
+            'description': 'Описание', 'posts_count': POSTS_TOTAL,
+        })
+        self.assertEqual(
+            len(self.walk('api_group_list', slug=self.group.slug)),
+            POSTS_TOTAL,
+        )
+        data = load(self.get('api_profile', username=self.author.username))
+        self.assertEqual(data['author'], {
+            'username': 'api_author', 'name': 'Лев Толстой',
+            'posts_count': POSTS_TOTAL, 'following': False,
+        })
+        self.assertEqual(
+            {item['author'] for item in data['results']}, {'api_author'}
+        )
+
+    def test_missing_objects_not_found(self):
+        for response in (
+            self.get('api_group_list', slug='missing'),
+            self.get('api_profile', username='missing'),
+            self.get('api_post_detail', post_id=10 ** 6),
+            self.get('api_comments', post_id=10 ** 6),
+        ):
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(load(response), {'error': 'not found'})
+
+    def test_follow_index(self):
+        self.assertEqual(Client().get(
+            reverse('posts:api_follow_index')
+        ).status_code, 401)
+        self.assertEqual(load(self.get('api_follow_index'))['results'], [])
+        Follow.objects.create(user=self.reader, author=self.author)
+        items = self.walk('api_follow_index')
+        self.assertEqual(len(items), POSTS_TOTAL)
+        self.assertEqual({item['author'] for item in items}, {'api_author'})
+
+    def test_post_detail_with_comments(self):
+        data = load(self.get(
+            'api_post_detail', '?fields=id,text&comment_fields=text',
+            post_id=self.post.pk,
+        ))
+        self.assertEqual(data['post'], {'id': self.post.pk, 'text': 'Чужой'})
+        self.assertEqual(data['comments_count'], COMMENTS_NUMBER + 5)
+        self.assertEqual(len(data['results']), COMMENTS_NUMBER)
+        self.assertEqual(list(data['results'][0]), ['text'])
+        rest = load(self.get(
+            'api_comments', f'?cursor={data["next_cursor"]}',
+            post_id=self.post.pk,
+        ))
+        self.assertEqual(len(rest['results']), 5)
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_unchanged_page_not_modified(self):
+        self.get('api_index')
+        response = self.get('api_index')
+        self.assertEqual(self.client.get(
+            reverse('posts:api_index'), HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+        self.assertEqual(
+            self.client.post(reverse('posts:api_index')).status_code, 405
+        )
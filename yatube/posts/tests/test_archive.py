@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import archive
+from posts.models import Comment, Group, Post, User
+
+POSTS_TOTAL = archive.CHUNK_SIZE + 3
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='archive_author')
+        cls.other = User.objects.create_user(username='archive_other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='archive-group', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост "{i}",\n')
+            for i in range(POSTS_TOTAL)
+        )
+        cls.foreign = Post.objects.create(author=cls.other, text='Чужой')
+        Comment.objects.create(
+            post=cls.foreign, author=cls.author, text='Комментарий'
+        )
+        Comment.objects.create(
+            post=cls.foreign, author=cls.other, text='Не его'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.url = reverse(
+            'posts:profile_export',
+            kwargs={'username': self.author.username},
+        )
+
+    def get(self, url, client=None):
+        # Недочитанный ответ держит место выгрузки до close().
+        response = (client or self.client).get(url)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['Content-Type'], archive.CONTENT_TYPES['ndjson']
+        )
+        self.assertIn('archive_author.ndjson',
+                      response['Content-Disposition'])
+        rows = [json.loads(line) for line in
+                self.content(response).splitlines()]
+        posts = [row for row in rows if row['type'] == 'post']
+        comments = [row for row in rows if row['type'] == 'comment']
+        self.assertEqual(len(posts), POSTS_TOTAL)
+        self.assertEqual(posts[0]['text'], 'Пост "0",\n')
+        self.assertEqual(posts[0]['group'], 'archive-group')
+        self.assertEqual(comments, [{
+            'type': 'comment',
+            'id': comments[0]['id'],
+            'post': self.foreign.pk,
+            'text': 'Комментарий',
+            'created': comments[0]['created'],
+            'updated': comments[0]['updated'],
+        }])
+
+    def test_csv_export(self):
+        response = self.client.get(self.url + '?format=csv')
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), POSTS_TOTAL + 1)
+        self.assertEqual(rows[0]['text'], 'Пост "0",\n')
+        self.assertEqual(rows[-1]['type'], 'comment')
+        self.assertEqual(rows[-1]['group'], '')
+
+    def test_only_author_exports(self):
+        client = Client()
+        client.force_login(self.other)
+        response = client.get(self.url)
+        self.assertRedirects(response, reverse(
+            'posts:profile', kwargs={'username': self.author.username}
+        ))
+        response = Client().get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.streaming)
+
+    def test_one_export_per_user(self):
+        """Вторая выгрузка, пока идёт первая, получает 429"""
+        first = self.get(self.url)
+        second = self.get(self.url)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second['Retry-After'], str(archive.RETRY_AFTER))
+        self.content(first)
+        self.assertEqual(self.get(self.url).status_code, 200)
+
+    @override_settings(POSTS_EXPORT_CONCURRENCY=1)
+    def test_concurrency_limit(self):
+        first = self.get(self.url)
+        client = Client()
+        client.force_login(self.other)
+        other_url = reverse(
+            'posts:profile_export',
+            kwargs={'username': self.other.username},
+        )
+        self.assertEqual(self.get(other_url, client).status_code, 429)
+        # Закрытый ответ освобождает место, даже если его не дочитали.
+        first.close()
+        self.assertEqual(self.get(other_url, client).status_code, 200)
+
+    @override_settings(POSTS_EXPORT_ROWS_PER_SECOND=archive.CHUNK_SIZE)
+    def test_rate_limit_sleeps_between_chunks(self):
+        with mock.patch('posts.archive.time.sleep') as sleep:
+            self.content(self.client.get(self.url))
+        sleep.assert_called_once()
+        self.assertAlmostEqual(sleep.call_args[0][0], 1, delta=0.5)
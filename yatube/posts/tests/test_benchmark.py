@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import seeding
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class SeedingTest(TestCase):
+    def test_seed_volumes(self):
+        """seed создаёт заданные объёмы и повторяет данные для того же seed"""
+        seeding.seed(users=5, groups=2, posts=50, comments=20, follows=8)
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), 8)
+        texts = list(Post.objects.order_by('pk').values_list(
+            'text', flat=True
+        ))
+        Post.objects.all().delete()
+        seeding.seed(users=5, groups=2, posts=50, comments=0, follows=0)
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list(
+            'text', flat=True
+        )), texts)
+
+
+class BenchmarkViewsTest(TestCase):
+    def test_benchmark_views(self):
+        """benchmark_views замеряет все безопасные адреса и пишет JSON"""
+        seeding.seed(users=5, groups=2, posts=30, comments=10, follows=8)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            # С холодным кэшем каждый ответ ходит в базу.
+            first, second = StringIO(), StringIO()
+            call_command('benchmark_views', repeat=2, warmup=0, deep_page=2,
+                         cold=True, output=output, stdout=first)
+            call_command('benchmark_views', repeat=2, warmup=0, deep_page=2,
+                         compare=output, threshold=1000, stdout=second)
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEqual(report['meta']['volumes']['posts'], 30)
+        results = report['results']
+        for name in ('index', 'group_list', 'profile', 'post_detail',
+                     'post_edit', 'follow_index', 'search',
+                     'index (page 2)'):
+            with self.subTest(name=name):
+                self.assertIn(name, results)
+                self.assertIn(results[name]['status'], (200, 302))
+                self.assertGreater(results[name]['queries'], 0)
+        self.assertNotIn('add_comment', results)
+        self.assertIn('index (page 2)', first.getvalue())
+        self.assertIn('Сравнение с ' + output, second.getvalue())
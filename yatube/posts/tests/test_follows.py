@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from posts import counters, follows
+from posts.models import Follow, Post, TimelineEntry, User
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class FollowsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        User.objects.bulk_create(
+            User(username=f'author{number}') for number in range(30)
+        )
+        cls.authors = list(User.objects.exclude(pk=cls.user.pk))
+        cls.names = [author.username for author in cls.authors]
+        cls.author = User.objects.get(username='author0')
+        Post.objects.create(author=cls.author, text='Пост')
+
+    def followers(self, author):
+        return counters.get_count(counters.FOLLOWERS, author.pk)
+
+    def test_follow_and_unfollow(self):
+        self.assertEqual(
+            follows.follow(self.user, ['author0']), [self.author.pk]
+        )
+        self.assertTrue(
+            Follow.objects.filter(user=self.user, author=self.author).exists()
+        )
+        self.assertEqual(self.followers(self.author), 1)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(),
+                         1)
+        self.assertEqual(
+            follows.unfollow(self.user, ['author0']), [self.author.pk]
+        )
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.followers(self.author), 0)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_repeated_follow_changes_nothing(self):
+        follows.follow(self.user, ['author0'])
+        self.assertEqual(follows.follow(self.user, ['author0', 'author0']),
+                         [])
+        self.assertEqual(follows.unfollow(self.user, ['author1']), [])
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(self.followers(self.author), 1)
+
+    def test_self_and_unknown_names_skipped(self):
+        self.assertEqual(follows.follow(self.user, ['reader', 'nobody']), [])
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_follow(self):
+        added = follows.follow(self.user, self.names)
+        self.assertCountEqual(added, [author.pk for author in self.authors])
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 30)
+        for author in self.authors:
+            self.assertEqual(self.followers(author), 1)
+        self.assertEqual(
+            counters.get_follow_count(self.user),
+            TimelineEntry.objects.filter(user=self.user).count(),
+        )
+        removed = follows.unfollow(self.user, self.names[:10])
+        self.assertEqual(len(removed), 10)
+        self.assertEqual(Follow.objects.count(), 20)
+        self.assertEqual(self.followers(self.authors[0]), 0)
+        self.assertEqual(self.followers(self.authors[-1]), 1)
+
+    def test_queries_do_not_grow_with_list(self):
+        queries = []
+        for names in (self.names[:1], self.names):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                follows.follow(self.user, names)
+                follows.unfollow(self.user, names)
+            queries.append(counter.count)
+        self.assertEqual(queries[0], queries[1])
+
+
+class FollowingCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh_user(self):
+        # В запросе пользователь каждый раз новый объект.
+        return User.objects.get(pk=self.user.pk)
+
+    def follows_author(self, author):
+        return follows.is_following(self.fresh_user(), author.pk)
+
+    def test_follow_and_unfollow_reset_cache(self):
+        self.assertFalse(self.follows_author(self.author))
+        follows.follow(self.user, ['author'])
+        self.assertTrue(self.follows_author(self.author))
+        self.assertFalse(self.follows_author(self.other))
+        Follow.objects.filter(user=self.user).delete()
+        self.assertFalse(self.follows_author(self.author))
+
+    def test_cached_lookup_without_queries(self):
+        follows.follow(self.user, ['author'])
+        self.follows_author(self.author)
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(follows.is_following(user, self.author.pk))
+            self.assertFalse(follows.is_following(user, self.other.pk))
+            self.assertFalse(follows.is_following(user, user.pk))
+
+    def test_long_follow_list_not_cached(self):
+        follows.follow(self.user, ['author', 'other'])
+        with mock.patch.object(follows, 'FOLLOWING_CACHE_MAX', 1):
+            user = self.fresh_user()
+            self.assertIsNone(follows.following(user))
+            self.assertTrue(follows.is_following(user, self.author.pk))
+        self.assertIsNone(
+            cache.get(follows.FOLLOWING_KEY.format(self.user.pk))
+        )
@@ -1,16 +1,23 @@
 from http import HTTPStatus
+from io import StringIO
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import features
 
+from posts import thumbnails
 from posts.models import Comment, Group, Post, User
 
 
 IMAGE_PATH = '/media/posts/small.gif'
+URL_INDEX = 'posts:index'
 URL_POST_DETAIL = 'posts:post_detail'
 URL_POST_CREATE = 'posts:post_create'
 URL_POST_EDIT = 'posts:post_edit'
@@ -42,6 +49,7 @@ class PostFormTests(TestCase):
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
+        cache.clear()
 
     @classmethod
     def tearDownClass(cls):
@@ -110,6 +118,95 @@ class PostFormTests(TestCase):
         self.assertNotEqual(source_post.group, form_data['group'])
         self.assertNotEqual(source_post.image.url, IMAGE_PATH)
 
+    def test_oversized_images_rejected(self):
+        """Слишком большой файл или картинка не сохраняются."""
+        limits = (
+            {'POSTS_IMAGE_MAX_SIZE': 10},
+            {'POSTS_IMAGE_MAX_SIDE': 1},
+            {'POSTS_IMAGE_MAX_PIXELS': 1},
+        )
+        for limit in limits:
+            with self.subTest(limit=limit), override_settings(**limit):
+                response = self.authorized_client.post(
+                    reverse(URL_POST_CREATE),
+                    data={
+                        'text': 'Пост с большой картинкой',
+                        'image': SimpleUploadedFile(
+                            name='big.gif',
+                            content=small_gif,
+                            content_type='image/gif',
+                        ),
+                    },
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.context['form'].has_error('image'))
+                self.assertFalse(Post.objects.exists())
+
+    def test_thumbnails_prepared_for_templates(self):
+        """Миниатюры готовятся заранее, шаблон берёт их из манифеста"""
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=small_gif, content_type='image/gif'
+            ),
+        )
+        self.assertIsNone(thumbnails.get_manifest(post))
+        manifest = thumbnails.generate(post.image.name)
+        # Манифест в базе: очистка кэша его не теряет.
+        cache.clear()
+        post.refresh_from_db()
+        self.assertEqual(thumbnails.get_manifest(post), manifest)
+        self.assertEqual(
+            (manifest['card']['width'], manifest['card']['height']),
+            (960, 339),
+        )
+        if features.check('webp'):
+            self.assertIn('.webp 320w', manifest['srcset']['webp'])
+        self.assertIn('.jpg 320w', manifest['srcset']['jpeg'])
+        response = self.guest_client.get(reverse(URL_INDEX))
+        self.assertContains(response, manifest['card']['url'])
+        self.assertContains(response, manifest['srcset']['jpeg'])
+
+    def test_render_never_generates_thumbnails(self):
+        """Пока миниатюр нет, шаблон показывает исходный файл и ничего
+        не ставит в очередь; их догоняет generate_thumbnails"""
+        with mock.patch('posts.thumbnails.schedule'):
+            post = Post.objects.create(
+                text='Пост с картинкой',
+                author=self.user,
+                image=SimpleUploadedFile(
+                    name='late.gif', content=small_gif,
+                    content_type='image/gif',
+                ),
+            )
+        with mock.patch('posts.thumbnails.schedule') as schedule, \
+                mock.patch('posts.thumbnails.generate') as generate:
+            response = self.guest_client.get(reverse(URL_INDEX))
+        schedule.assert_not_called()
+        generate.assert_not_called()
+        self.assertContains(response, post.image.url)
+        call_command('generate_thumbnails', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertIsNotNone(thumbnails.get_manifest(post))
+
+    def test_replaced_image_needs_new_thumbnails(self):
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='first.gif', content=small_gif,
+                content_type='image/gif',
+            ),
+        )
+        thumbnails.generate(post.image.name)
+        post.refresh_from_db()
+        post.image = SimpleUploadedFile(
+            name='second.gif', content=small_gif, content_type='image/gif'
+        )
+        post.save()
+        self.assertIsNone(thumbnails.get_manifest(post))
+
 
 class CommentFormTests(TestCase):
     @classmethod
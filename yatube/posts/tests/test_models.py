@@ -1,7 +1,13 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models.signals import post_save
 from django.test import TestCase
+from django.urls import reverse
 
+from posts import caching, counters, transfer
 from posts.models import (
-    ADMIN_NUMBER_OF_CHARACTERS, Comment, Follow, Group, Post, User
+    ADMIN_NUMBER_OF_CHARACTERS, Comment, Counter, Follow, Group, Post, User
 )
 
 
@@ -163,3 +169,182 @@ class FollowModelTest(TestCase):
                         follow._meta.get_field(field).help_text,
                         expected_value
                     )
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='group',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other',
+            description='Тестовое описание',
+        )
+
+    def assertCounts(self, expected):
+        for (name, object_id), value in expected.items():
+            with self.subTest(name=name, object_id=object_id):
+                self.assertEqual(counters.get_count(name, object_id), value)
+
+    def test_counters_follow_save_and_delete(self):
+        """Счётчики меняются при создании, правке и удалении"""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост'
+        )
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Пост без группы'),
+            Post(author=self.user, group=self.group, text='Ещё пост'),
+        ])
+        Comment.objects.create(post=post, author=self.user, text='Ком')
+        self.assertCounts({
+            (counters.POSTS, 0): 3,
+            (counters.AUTHOR_POSTS, self.user.pk): 3,
+            (counters.GROUP_POSTS, self.group.pk): 2,
+            (counters.POST_COMMENTS, post.pk): 1,
+        })
+        post.group = self.other_group
+        post.save()
+        self.assertCounts({
+            (counters.GROUP_POSTS, self.group.pk): 1,
+            (counters.GROUP_POSTS, self.other_group.pk): 1,
+        })
+        post.delete()
+        self.assertCounts({
+            (counters.POSTS, 0): 2,
+            (counters.AUTHOR_POSTS, self.user.pk): 2,
+            (counters.GROUP_POSTS, self.other_group.pk): 0,
+            (counters.POST_COMMENTS, post.pk): 0,
+        })
+
+    def test_reconcile_fixes_drift(self):
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        Counter.objects.update(value=100)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounts({
+            (counters.POSTS, 0): 1,
+            (counters.AUTHOR_POSTS, self.user.pk): 1,
+            (counters.GROUP_POSTS, self.group.pk): 1,
+        })
+
+
+class VersionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='versions')
+        cls.first = Group.objects.create(
+            title='Первая', slug='first', description='Описание'
+        )
+        cls.second = Group.objects.create(
+            title='Вторая', slug='second', description='Описание'
+        )
+
+    def test_post_edit_bumps_version(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        self.assertEqual(post.version, 1)
+        created = post.updated
+        post.text = 'Правка'
+        post.save()
+        self.assertEqual(post.version, 2)
+        self.assertGreaterEqual(post.updated, created)
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.version, 3)
+
+    def test_stale_instances_do_not_share_version(self):
+        """Две правки одного поста из разных объектов: номер растёт
+        в самом UPDATE"""
+        post = Post.objects.create(author=self.user, text='Пост')
+        stale = Post.objects.get(pk=post.pk)
+        post.save()
+        stale.save()
+        self.assertEqual([post.version, stale.version], [2, 3])
+
+    def test_post_save_sees_new_version(self):
+        """Обработчики post_save получают номер, а не выражение F"""
+        post = Post.objects.create(author=self.user, text='Пост')
+        seen = []
+
+        def receiver(sender, instance, **kwargs):
+            seen.append(instance.version)
+
+        post_save.connect(receiver, sender=Post)
+        self.addCleanup(post_save.disconnect, receiver, sender=Post)
+        post.save()
+        self.assertEqual(seen, [2])
+
+    def test_empty_update_fields_no_op(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        with self.assertNumQueries(0):
+            post.save(update_fields=[])
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+
+    def test_comment_edit_bumps_version(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий'
+        )
+        comment.text = 'Правка'
+        comment.save()
+        self.assertEqual(comment.version, 2)
+
+    def test_scopes_follow_post_changes(self):
+        scopes = [(caching.AUTHOR, self.user.pk),
+                  (caching.GROUP, self.first.pk)]
+        author, group, _ = caching.scope_versions(scopes)
+        post = Post.objects.create(
+            author=self.user, group=self.first, text='Пост'
+        )
+        post.delete()
+        self.assertEqual(
+            caching.scope_versions(scopes)[:2], [author + 2, group + 2]
+        )
+
+    def test_admin_list_editable_group_change(self):
+        """Смена группы в списке постов админки меняет версию поста и
+        версии обеих групп в кэше"""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        post = Post.objects.create(
+            author=self.user, group=self.first, text='Пост'
+        )
+        groups = [(caching.GROUP, self.first.pk),
+                  (caching.GROUP, self.second.pk)]
+        before = caching.scope_versions(groups)[:2]
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {
+                'form-TOTAL_FORMS': '1',
+                'form-INITIAL_FORMS': '1',
+                'form-MIN_NUM_FORMS': '0',
+                'form-MAX_NUM_FORMS': '1000',
+                'form-0-id': str(post.pk),
+                'form-0-group': str(self.second.pk),
+                '_save': 'Сохранить',
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        post.refresh_from_db()
+        self.assertEqual(post.group, self.second)
+        self.assertEqual(post.version, 2)
+        self.assertEqual(
+            caching.scope_versions(groups)[:2],
+            [version + 1 for version in before],
+        )
+
+    def test_rows_inserted_without_orm_get_defaults(self):
+        transfer.insert_rows(
+            Post, ('id', 'author', 'text', 'image'),
+            [(1000, self.user.pk, 'Пост', '')],
+        )
+        post = Post.objects.get(pk=1000)
+        self.assertEqual(post.version, 1)
+        self.assertIsNone(post.updated)
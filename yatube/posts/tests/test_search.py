@@ -0,0 +1,62 @@
+from django.test import Client, TestCase, override_settings
+
+from posts import search
+from posts.models import Post, User
+from posts.stemmer import stem
+
+URL_ADMIN_POSTS = '/admin/posts/post/'
+
+
+class StemmerTest(TestCase):
+    def test_word_forms_share_stem(self):
+        """Формы одного слова сводятся к одной основе"""
+        forms = (
+            ('кошка', 'кошки', 'кошкам', 'кошками'),
+            ('красивый', 'красивая', 'красивейший', 'красивыми'),
+            ('читать', 'читающий', 'читали'),
+            ('ёлка', 'Ёлки', 'елками'),
+        )
+        for words in forms:
+            with self.subTest(words=words):
+                self.assertEqual(len({stem(word) for word in words}), 1)
+
+    def test_terms(self):
+        self.assertEqual(
+            search.terms('Деятельность, Ёжики и 42 КОШКИ!'),
+            ['деятельн', 'ежик', 'и', '42', 'кошк'],
+        )
+
+
+class AdminSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.post = Post.objects.create(
+            author=cls.admin, text='Мы кормили бездомную кошку'
+        )
+        Post.objects.create(author=cls.admin, text='Про собак')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def found(self, query):
+        response = self.client.get(URL_ADMIN_POSTS, {'q': query})
+        return list(response.context['cl'].result_list)
+
+    def check_found(self):
+        self.assertEqual(self.found('бездомная кошка'), [self.post])
+        self.assertEqual(self.found('кормить бездомного'), [self.post])
+        self.assertEqual(self.found('кошка собака'), [])
+
+    def test_admin_search_by_stems(self):
+        """Админка ищет посты по основам слов"""
+        self.check_found()
+
+    @override_settings(POSTS_SEARCH_BACKEND='index')
+    def test_admin_search_index_backend(self):
+        search.rebuild()
+        self.check_found()
@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import counters, transfer
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='exporter')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост, "в кавычках"'
+        )
+        Post.objects.create(author=cls.reader, text='Пост без группы')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def snapshot(self):
+        return (
+            list(Group.objects.values_list('slug', 'title', 'description')),
+            list(Post.objects.order_by('pk').values_list(
+                'pk', 'author__username', 'group__slug', 'text', 'created'
+            )),
+            list(Comment.objects.values_list(
+                'pk', 'post_id', 'author__username', 'text', 'created'
+            )),
+            list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        )
+
+    def wipe(self):
+        for model in (Comment, Follow, Post, Group, User):
+            model.objects.all().delete()
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка сохраняют данные, даты и ссылки"""
+        for file_format in transfer.FORMATS:
+            with self.subTest(file_format=file_format):
+                before = self.snapshot()
+                call_command(
+                    'export_data', self.directory, format=file_format,
+                    stdout=open(os.devnull, 'w'),
+                )
+                self.wipe()
+                call_command(
+                    'import_data', self.directory,
+                    stdout=open(os.devnull, 'w'),
+                )
+                self.assertEqual(self.snapshot(), before)
+                self.assertEqual(
+                    counters.get_count(counters.POSTS), len(before[1])
+                )
+                self.assertTrue(TimelineEntry.objects.exists())
+                for name in ('groups', 'posts', 'comments', 'follows'):
+                    os.remove(os.path.join(
+                        self.directory, f'{name}.{file_format}'
+                    ))
+
+    def test_csv_keeps_empty_text(self):
+        """Пустой текст в CSV остаётся пустой строкой, а не NULL"""
+        Group.objects.filter(pk=self.group.pk).update(description='')
+        Comment.objects.update(text='')
+        before = self.snapshot()
+        call_command(
+            'export_data', self.directory, format='csv',
+            stdout=open(os.devnull, 'w'),
+        )
+        self.wipe()
+        call_command(
+            'import_data', self.directory, stdout=open(os.devnull, 'w')
+        )
+        self.assertEqual(self.snapshot(), before)
+
+    def test_resume(self):
+        """Прерванная загрузка продолжается, повторы пропускаются"""
+        before = self.snapshot()
+        call_command(
+            'export_data', self.directory, stdout=open(os.devnull, 'w')
+        )
+        self.wipe()
+        # Первая пачка постов уже загружена, а состояние не записано
+        # дальше первого поста.
+        with open(os.path.join(self.directory, transfer.STATE_FILE),
+                  'w') as file:
+            json.dump({'groups': 1, 'posts': 1}, file)
+        Group.objects.create(**dict(zip(
+            ('slug', 'title', 'description'), before[0][0]
+        )))
+        importer = transfer.Importer(self.directory, batch_size=1)
+        importer.run()
+        self.assertEqual(Post.objects.count(), 1)
+        importer = transfer.Importer(self.directory, batch_size=1)
+        importer.run()
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, transfer.STATE_FILE)
+        ))
@@ -1,11 +1,26 @@
+import base64
+import re
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import get_template
 from django.urls import reverse
 
+from posts import caching, cards, counters, follows, search, timeline
 from posts.forms import PostForm
-from posts.models import Comment, Group, Follow, Post, User
-from posts.utils import POSTS_NUMBER
+from posts.models import Comment, Group, Follow, Post, TimelineEntry, User
+from posts.utils import (COMMENTS_MAX_LIMIT, COMMENTS_NUMBER, POSTS_NUMBER,
+                         decode_cursor)
 
 LIST_OF_TEST_POSTS = 13
 URL_INDEX = 'posts:index'
@@ -16,6 +31,8 @@ URL_POST_DETAIL = 'posts:post_detail'
 URL_POST_CREATE = 'posts:post_create'
 URL_POST_EDIT = 'posts:post_edit'
 URL_ADD_COMMENT = 'posts:add_comment'
+URL_SEARCH = 'posts:search'
+URL_COMMENTS = 'posts:comments'
 small_gif = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
     b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -188,6 +205,57 @@ class PaginatorViewsTest(TestCase):
                 (LIST_OF_TEST_POSTS - POSTS_NUMBER)
             )
 
+    def test_keyset_pages_walk_whole_feed(self):
+        """Курсорная пагинация проходит ленту без пропусков и повторов"""
+        pages = [
+            reverse(URL_INDEX),
+            reverse(URL_PROFILE, kwargs={'username': self.post_pag.author}),
+            reverse(URL_GROUP_LIST, kwargs={'slug': self.group_pag.slug}),
+        ]
+        for url in pages:
+            with self.subTest(url=url):
+                first = self.client.get(url + '?cursor=').context['page_obj']
+                self.assertEqual(len(first), POSTS_NUMBER)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    url + '?cursor=' + first.next_cursor
+                ).context['page_obj']
+                self.assertEqual(
+                    len(second), LIST_OF_TEST_POSTS - POSTS_NUMBER
+                )
+                self.assertFalse(second.has_next())
+                seen = [post.pk for post in list(first) + list(second)]
+                self.assertEqual(len(set(seen)), LIST_OF_TEST_POSTS)
+                back = self.client.get(
+                    url + '?cursor=' + second.previous_cursor
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(reverse(URL_INDEX) + '?cursor=broken')
+        self.assertEqual(len(response.context['page_obj']), POSTS_NUMBER)
+
+    def test_cursor_id_out_of_range_returns_first_page(self):
+        """Курсор с id вне диапазона целых базы — как испорченный"""
+        for pk in (0, 2 ** 63, 10 ** 23):
+            raw = f'n|2020-01-01T00:00:00+00:00|{pk}'
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            with self.subTest(pk=pk):
+                self.assertIsNone(decode_cursor(cursor))
+                response = self.client.get(
+                    reverse(URL_INDEX), {'cursor': cursor}
+                )
+                self.assertEqual(
+                    len(response.context['page_obj']), POSTS_NUMBER
+                )
+                response = self.client.get(
+                    reverse(URL_COMMENTS,
+                            kwargs={'post_id': self.post_pag.pk}),
+                    {'cursor': cursor},
+                )
+                self.assertEqual(response.status_code, 200)
+
 
 class CacheTests(TestCase):
     @classmethod
@@ -219,6 +287,43 @@ class CacheTests(TestCase):
         )
         self.assertNotEqual(response_1, response_2)
 
+    def test_new_post_is_visible_without_cache_clear(self):
+        """Кэш ленты сбрасывается при создании и правке поста"""
+        self.guest_client.get(reverse(URL_INDEX))
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Свежий пост'
+        )
+        response = self.guest_client.get(reverse(URL_INDEX))
+        self.assertContains(response, 'Свежий пост')
+        post.text = 'Исправленный пост'
+        post.save()
+        response = self.guest_client.get(reverse(URL_INDEX))
+        self.assertContains(response, 'Исправленный пост')
+        self.assertNotContains(response, 'Свежий пост')
+
+    def test_feed_page_served_from_cache(self):
+        Post.objects.create(author=self.user, text='Пост')
+        self.guest_client.get(reverse(URL_INDEX))
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse(URL_INDEX))
+        self.assertFalse(
+            [q for q in queries if 'posts_post' in q['sql']],
+            'при повторном запросе лента не должна читаться из базы'
+        )
+
+    def test_feed_page_key_ignores_other_params(self):
+        Post.objects.create(author=self.user, text='Пост')
+        self.guest_client.get(reverse(URL_INDEX), {'page': 1})
+        for params in ({'page': 1, 'utm_source': 'x'}, {'page': 'abc'}):
+            with self.subTest(params=params), \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.guest_client.get(reverse(URL_INDEX), params)
+                self.assertContains(response, 'Пост')
+            self.assertFalse(
+                [q for q in queries if 'posts_post' in q['sql']],
+                'посторонние параметры не должны давать новый ключ'
+            )
+
 
 class CommentViewsTest(TestCase):
     @classmethod
@@ -259,6 +364,74 @@ class CommentViewsTest(TestCase):
         )
 
 
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(COMMENTS_NUMBER + 5)
+        )
+        cls.newest = list(cls.post.comments.order_by('-created', '-pk'))
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_post_detail_renders_first_page(self):
+        """На странице поста только первая страница комментариев"""
+        response = self.client.get(
+            reverse(URL_POST_DETAIL, kwargs={'post_id': self.post.id})
+        )
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.newest[:COMMENTS_NUMBER])
+        self.assertTrue(comments.has_next())
+        self.assertEqual(response.context['comments_count'],
+                         COMMENTS_NUMBER + 5)
+
+    def test_post_detail_queries_do_not_grow(self):
+        """Число запросов не зависит от числа комментариев"""
+        url = reverse(URL_POST_DETAIL, kwargs={'post_id': self.post.id})
+        other = Post.objects.create(author=self.user, text='Другой')
+        Comment.objects.create(post=other, author=self.user, text='Один')
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(
+                reverse(URL_POST_DETAIL, kwargs={'post_id': other.id})
+            )
+        self.assertEqual(len(many), len(one))
+
+    def test_load_more_comments(self):
+        """Подгрузка отдаёт следующие комментарии фрагментом и JSON"""
+        first = self.client.get(
+            reverse(URL_POST_DETAIL, kwargs={'post_id': self.post.id})
+        ).context['comments']
+        url = reverse(URL_COMMENTS, kwargs={'post_id': self.post.id})
+        response = self.client.get(url, {'cursor': first.next_cursor})
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(list(response.context['comments']),
+                         self.newest[COMMENTS_NUMBER:])
+        self.assertNotContains(response, '<html')
+        data = self.client.get(url, {
+            'cursor': first.next_cursor, 'format': 'json', 'limit': 2,
+        }).json()
+        self.assertEqual(
+            [comment['id'] for comment in data['comments']],
+            [comment.id for comment in self.newest[COMMENTS_NUMBER:][:2]],
+        )
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_limit_capped(self):
+        with mock.patch('posts.views.COMMENTS_MAX_LIMIT', 3):
+            data = self.client.get(
+                reverse(URL_COMMENTS, kwargs={'post_id': self.post.id}),
+                {'format': 'json', 'limit': COMMENTS_MAX_LIMIT},
+            ).json()
+        self.assertEqual(len(data['comments']), 3)
+
+
 class FollowTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -348,3 +521,533 @@ class FollowTest(TestCase):
             follow_index,
             'на странице есть посты от нечитаемых авторов'
         )
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='reader', first_name='Имя', last_name='Фамилия'
+        )
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='group-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        return len(queries)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        """Число запросов ленты не зависит от количества постов"""
+        urls = [
+            reverse(URL_INDEX),
+            reverse(URL_GROUP_LIST, kwargs={'slug': self.group.slug}),
+            reverse(URL_PROFILE, kwargs={'username': self.author.username}),
+            reverse(URL_FOLLOW_INDEX),
+        ]
+        Post.objects.create(
+            author=self.author, group=self.group, text='Первый пост'
+        )
+        expected = {url: self.count_queries(url) for url in urls}
+        for i in range(POSTS_NUMBER):
+            Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), expected[url])
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def follow_page(self):
+        return self.authorized_client.get(
+            reverse(URL_FOLLOW_INDEX)
+        ).context['page_obj']
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        """Подписка добавляет старые посты, новые рассылаются"""
+        Follow.objects.create(user=self.user, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 2
+        )
+        self.assertEqual(list(self.follow_page()), [new_post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+        self.assertEqual(len(self.follow_page()), 0)
+
+    def test_popular_author_is_read_on_demand(self):
+        """Посты популярного автора не рассылаются, но есть в ленте"""
+        with mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 0):
+            Follow.objects.create(user=self.user, author=self.author)
+            new_post = Post.objects.create(author=self.author, text='Новый')
+            self.assertFalse(TimelineEntry.objects.filter(user=self.user))
+            self.assertEqual(
+                list(self.follow_page()), [new_post, self.old_post]
+            )
+
+    def followers(self, number):
+        users = [self.user] + [
+            User.objects.create_user(username=f'follower_{i}')
+            for i in range(number - 1)
+        ]
+        for user in users:
+            Follow.objects.create(user=user, author=self.author)
+        return users
+
+    @mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 2)
+    def test_posts_stay_when_author_drops_under_limit(self):
+        """Посты, написанные без рассылки, остаются в лентах, когда
+        у автора снова мало подписчиков"""
+        users = self.followers(3)
+        popular_post = Post.objects.create(author=self.author, text='Хит')
+        Follow.objects.filter(user=users[-1]).delete()
+        self.assertEqual(
+            list(self.follow_page()), [popular_post, self.old_post]
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(post=popular_post).count(), 2
+        )
+        self.assertEqual(counters.get_follow_count(self.user), 2)
+
+    @mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 2)
+    def test_batch_unfollow_refills_timelines(self):
+        users = self.followers(3)
+        popular_post = Post.objects.create(author=self.author, text='Хит')
+        follows.unfollow(users[-1], [self.author.username])
+        self.assertEqual(
+            list(self.follow_page()), [popular_post, self.old_post]
+        )
+
+    def test_popular_author_posts_not_repeated(self):
+        """Пост, разосланный до того, как автор стал популярным,
+        не повторяется в ленте"""
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(POSTS_NUMBER)
+        ]
+        with mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 0):
+            posts.append(Post.objects.create(author=self.author, text='Ещё'))
+            first = self.follow_page()
+            second = self.authorized_client.get(
+                reverse(URL_FOLLOW_INDEX), {'page': 2}
+            ).context['page_obj']
+        expected = [*reversed(posts), self.old_post]
+        self.assertEqual(list(first) + list(second), expected)
+        self.assertEqual(first.paginator.count, len(expected))
+
+    def test_follow_adds_all_posts_of_author(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}')
+            for i in range(LIST_OF_TEST_POSTS)
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(
+            len(timeline.feed(self.user)[:100]),
+            counters.get_follow_count(self.user),
+        )
+
+    @mock.patch('posts.timeline.BACKFILL_POSTS', 3)
+    def test_follow_copies_newest_posts_only(self):
+        """Подписка копирует в ленту только новейшие посты автора,
+        остальные лента читает из постов"""
+        other = User.objects.create_user(username='other_writer')
+        Follow.objects.create(user=self.user, author=other)
+        for i in range(POSTS_NUMBER):
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            Post.objects.create(author=other, text=f'Другой {i}')
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.user, post__author=self.author
+        ).count(), 3)
+        expected = list(Post.objects.order_by('-created', '-pk'))
+        feed = timeline.feed(self.user)
+        self.assertEqual(list(feed[:100]), expected)
+        self.assertEqual(list(feed[5:8]), expected[5:8])
+        self.assertEqual(
+            list(feed.order_by('created', 'pk')[:100]), expected[::-1]
+        )
+        pages = []
+        page = self.follow_page()
+        while True:
+            pages += list(page)
+            if not page.has_next():
+                break
+            page = self.authorized_client.get(
+                reverse(URL_FOLLOW_INDEX), {'page': page.next_page_number()}
+            ).context['page_obj']
+        self.assertEqual(pages, expected)
+
+    @mock.patch('posts.timeline.BACKFILL_POSTS', 1)
+    @mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 2)
+    def test_refill_copies_newest_posts_only(self):
+        users = self.followers(3)
+        popular = [
+            Post.objects.create(author=self.author, text=f'Хит {i}')
+            for i in range(3)
+        ]
+        Follow.objects.filter(user=users[-1]).delete()
+        self.assertEqual(TimelineEntry.objects.filter(
+            post__in=popular
+        ).count(), 2)
+        self.assertEqual(
+            list(self.follow_page()), [*reversed(popular), self.old_post]
+        )
+
+    def test_feed_pages_timeline_index(self):
+        """Страница ленты читается по индексу записей, без сортировки
+        всех записей пользователя"""
+        plan = timeline.feed(self.user)[:POSTS_NUMBER].explain()
+        entries = [
+            line for line in plan.splitlines() if 'timelineentry' in line
+        ]
+        self.assertEqual(len(entries), 1)
+        self.assertIn('timeline_user_feed_idx', entries[0])
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='searcher')
+        cls.group = Group.objects.create(
+            title='Кошки', slug='cats', description='Всё о котах'
+        )
+        cls.rare = Post.objects.create(
+            author=cls.author, text='Кошки спят. Кошки едят. Собака лает.'
+        )
+        cls.common = Post.objects.create(
+            author=cls.author,
+            text='Кошки, собака и ещё много слов про погоду',
+            group=cls.group,
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Просто пост {i}')
+            for i in range(LIST_OF_TEST_POSTS)
+        )
+        search.rebuild()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse(URL_SEARCH), {'q': query, **params}
+        ).context
+
+    def check_search(self):
+        context = self.search('собака КОШКИ')
+        self.assertEqual(list(context['page_obj']), [self.rare, self.common])
+        self.assertEqual(list(self.search('кошки')['groups']), [self.group])
+        self.assertEqual(len(self.search('кошки мыши')['page_obj']), 0)
+        page = self.search('пост', page=2)['page_obj']
+        self.assertEqual(page.paginator.count, LIST_OF_TEST_POSTS)
+        self.assertEqual(len(page), LIST_OF_TEST_POSTS - POSTS_NUMBER)
+
+    def test_search_ranks_and_paginates(self):
+        """Поиск находит посты со всеми словами, частые выше"""
+        self.check_search()
+
+    @override_settings(POSTS_SEARCH_BACKEND='index')
+    def test_index_backend(self):
+        search.rebuild()
+        self.check_search()
+
+    def test_index_follows_edits(self):
+        post = Post.objects.get(pk=self.rare.pk)
+        post.text = 'Теперь про мышей'
+        post.save()
+        Post.objects.filter(pk=self.common.pk).delete()
+        self.assertEqual(len(self.search('собака')['page_obj']), 0)
+        self.assertEqual(list(self.search('мышей')['page_obj']), [post])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='etag-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост'
+        )
+        cls.other = Post.objects.create(author=cls.reader, text='Другой')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.urls = {
+            'index': reverse(URL_INDEX),
+            'group': reverse(URL_GROUP_LIST,
+                             kwargs={'slug': self.group.slug}),
+            'profile': reverse(URL_PROFILE,
+                               kwargs={'username': self.user.username}),
+            'post': reverse(URL_POST_DETAIL,
+                            kwargs={'post_id': self.post.id}),
+        }
+
+    def etags(self):
+        # Первый ответ ставит CSRF-cookie, и ETag меняется один раз.
+        for url in self.urls.values():
+            self.client.get(url)
+        return {
+            name: self.client.get(url)['ETag']
+            for name, url in self.urls.items()
+        }
+
+    def statuses(self, etags):
+        return {
+            name: self.client.get(
+                self.urls[name], HTTP_IF_NONE_MATCH=etag
+            ).status_code
+            for name, etag in etags.items()
+        }
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменная страница отдаётся ответом 304 без шаблонов"""
+        etags = self.etags()
+        self.assertEqual(set(self.statuses(etags).values()), {304})
+        response = self.client.get(
+            self.urls['post'], HTTP_IF_NONE_MATCH=etags['post']
+        )
+        self.assertEqual(response.content, b'')
+        self.assertFalse(response.templates)
+
+    def test_edit_changes_author_group_and_post(self):
+        etags = self.etags()
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        self.assertEqual(self.statuses(etags), {
+            'index': 200, 'group': 200, 'profile': 200, 'post': 200,
+        })
+
+    def test_comment_changes_only_post(self):
+        etags = self.etags()
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        self.assertEqual(self.statuses(etags), {
+            'index': 304, 'group': 304, 'profile': 304, 'post': 200,
+        })
+
+    def test_other_author_post_keeps_pages(self):
+        etags = self.etags()
+        Post.objects.create(author=self.reader, text='Ещё пост')
+        statuses = self.statuses(etags)
+        self.assertEqual(statuses['index'], 200)
+        self.assertEqual(
+            [statuses['group'], statuses['profile'], statuses['post']],
+            [304, 304, 304],
+        )
+
+    def test_author_rename_changes_author_pages(self):
+        """Имя автора на всех страницах с его постами; вход автора
+        страниц не меняет"""
+        etags = self.etags()
+        Client().force_login(self.user)
+        self.assertEqual(set(self.statuses(etags).values()), {304})
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        self.assertEqual(self.statuses(etags), {
+            'index': 200, 'group': 200, 'profile': 200, 'post': 200,
+        })
+
+    def test_etag_depends_on_viewer(self):
+        """Другой пользователь, подписка и страница дают другой ETag"""
+        etags = self.etags()
+        guest = Client()
+        self.assertEqual(guest.get(
+            self.urls['post'], HTTP_IF_NONE_MATCH=etags['post']
+        ).status_code, 200)
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(
+            self.statuses({'profile': etags['profile']})['profile'], 200
+        )
+        response = self.client.get(
+            self.urls['index'] + '?page=2',
+            HTTP_IF_NONE_MATCH=etags['index'],
+        )
+        self.assertNotEqual(response.status_code, 304)
+
+    def test_missing_object_not_found(self):
+        response = self.client.get(
+            reverse(URL_POST_DETAIL, kwargs={'post_id': 10 ** 6}),
+            HTTP_IF_NONE_MATCH='"x"',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_replay_traffic(self):
+        out = StringIO()
+        call_command(
+            'replay_traffic', requests=60, visitors=3, write_ratio=0.1,
+            stdout=out,
+        )
+        self.assertIn('ответов 304', out.getvalue())
+        self.assertEqual(Post.objects.count(), 2)
+
+
+def squeeze(html):
+    """HTML без пробелов вокруг тегов и с одиночными пробелами."""
+    html = re.sub(r'\s*(<[^>]+>)\s*', r'\1', str(html))
+    return re.sub(r'\s+', ' ', html).strip()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='card_author', first_name='<Имя>', last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Группа & <b>', slug='card-group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, group=cls.group,
+                text='Строка <i>\nвторая строка ' + 'длинно ' * 50,
+            ),
+            Post.objects.create(author=cls.user, text='Без группы'),
+            Post.objects.create(
+                author=cls.user, group=cls.group, text='С картинкой',
+                image=SimpleUploadedFile(
+                    name='card.gif', content=small_gif,
+                    content_type='image/gif',
+                ),
+            ),
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fast_card_matches_template(self):
+        """posts.cards даёт ту же разметку, что includes/post.html"""
+        template = get_template('includes/post.html')
+        for post in Post.objects.for_feed():
+            for profile_link in (False, True):
+                for group_link in (False, True):
+                    with self.subTest(post=post.text[:10],
+                                      profile=profile_link,
+                                      group=group_link):
+                        cache.clear()
+                        expected = template.render({
+                            'post': post,
+                            'show_profile_link': profile_link,
+                            'show_group_link': group_link,
+                        })
+                        self.assertEqual(
+                            squeeze(cards.render_card(
+                                post, profile_link, group_link
+                            )),
+                            squeeze(expected),
+                        )
+
+    def test_cards_share_template_cache(self):
+        """Карточка из кэша фрагмента шаблона не рисуется заново"""
+        post = self.posts[1]
+        get_template('includes/post.html').render({
+            'post': post, 'show_profile_link': True,
+            'show_group_link': True,
+        })
+        with mock.patch('posts.cards.render_card') as render_card:
+            card, = cards.render_cards([post], True, True)
+        render_card.assert_not_called()
+        self.assertIn('Без группы', card)
+
+    def test_card_follows_post_version(self):
+        """Правка в обход сигналов с новой версией даёт новую карточку"""
+        post = Post.objects.for_feed().get(pk=self.posts[1].pk)
+        cards.render_cards([post], True, True)
+        Post.objects.filter(pk=post.pk).update(
+            text='Новый текст', version=F('version') + 1
+        )
+        post = Post.objects.for_feed().get(pk=post.pk)
+        card, = cards.render_cards([post], True, True)
+        self.assertIn('Новый текст', card)
+
+    def test_edit_forgets_old_card(self):
+        post = Post.objects.for_feed().get(pk=self.posts[1].pk)
+        cards.render_cards([post], True, True)
+        key = caching.card_key(post.pk, post.version, True, True)
+        self.assertIsNotNone(cache.get(key))
+        post.text = 'Правка'
+        post.save()
+        self.assertIsNone(cache.get(key))
+
+    def test_card_follows_author_rename(self):
+        url = reverse(URL_INDEX)
+        self.assertIn('&lt;Имя&gt;', self.client.get(url).content.decode())
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Переименован'
+        author.save()
+        content = self.client.get(url).content.decode()
+        self.assertIn('Переименован Фамилия', content)
+        self.assertNotIn('&lt;Имя&gt;', content)
+
+    def test_feeds_render_same_with_and_without_fast_cards(self):
+        urls = [
+            reverse(URL_INDEX),
+            reverse(URL_GROUP_LIST, kwargs={'slug': self.group.slug}),
+            reverse(URL_PROFILE, kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                fast = self.client.get(url).content.decode()
+                cache.clear()
+                with override_settings(POSTS_FAST_CARDS=False):
+                    slow = self.client.get(url).content.decode()
+                self.assertEqual(squeeze(fast), squeeze(slow))
+                self.assertIn('<article>', fast)
+
+    def test_paginator_shows_page_window(self):
+        """Пагинатор показывает соседние страницы, а не все номера"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}')
+            for i in range(POSTS_NUMBER * 20)
+        )
+        response = self.client.get(reverse(URL_INDEX) + '?page=10')
+        content = response.content.decode()
+        pages = {int(n) for n in re.findall(r'\?page=(\d+)', content)}
+        # Первая, последняя и по четыре соседних с обеих сторон.
+        self.assertEqual(pages, {1, 21} | set(range(6, 15)) - {10})
+
+    def test_benchmark_cards(self):
+        out = StringIO()
+        call_command('benchmark_cards', pages=1, repeat=1, stdout=out)
+        self.assertIn('быстрее в', out.getvalue())
@@ -0,0 +1,145 @@
+"""Заранее подготовленные миниатюры картинок постов.
+
+Миниатюры делаются в фоновом пуле потоков сразу после сохранения
+поста, а их адреса складываются в манифест в поле Post.renditions.
+Шаблоны только читают манифест: не вызывают Pillow, не ставят файлы
+в очередь и не сбрасывают кэш. Пока манифеста нет, показывается
+исходная картинка; посты, для которых миниатюры так и не сделаны,
+догоняет команда generate_thumbnails.
+
+Кроме основной миниатюры 960x339 в JPEG готовится набор ширин в WebP
+и JPEG для srcset; sorl сохраняет их без EXIF, с optimize и
+прогрессивным JPEG. Ширины больше исходной картинки не делаются,
+а WebP пропускается, если Pillow собран без libwebp.
+При POSTS_THUMBNAIL_WORKERS = 0 миниатюры делаются сразу после
+фиксации транзакции в текущем потоке.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, features
+from sorl.thumbnail import get_thumbnail
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Ширины для srcset, пропорции карточки и форматы по убыванию
+# предпочтения браузера.
+SRCSET_WIDTHS = (320, 640, 960, 1920)
+CARD_RATIO = 339 / 960
+SRCSET_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+SRCSET_QUALITY = 80
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def get_manifest(post):
+    """Готовые миниатюры картинки поста: {alias: {'url', 'width',
+    'height'}} и {'srcset': {формат: 'адрес ширинаw, ...'}}.
+
+    None — миниатюры ещё не готовы, пустой манифест — файл не удалось
+    обработать. Манифест другого файла (картинку заменили) не годится.
+    """
+    if not post.renditions:
+        return None
+    manifest = json.loads(post.renditions)
+    if manifest.pop('name', None) != post.image.name:
+        return None
+    return manifest
+
+
+def srcset(name):
+    """Строки srcset для каждого формата."""
+    with default_storage.open(name) as source:
+        source_width = Image.open(source).size[0]
+    widths = [w for w in SRCSET_WIDTHS if w <= source_width]
+    result = {}
+    for key, image_format in SRCSET_FORMATS.items():
+        if key == 'webp' and not features.check('webp'):
+            continue
+        candidates = []
+        for width in widths or SRCSET_WIDTHS[:1]:
+            thumbnail = get_thumbnail(
+                name,
+                f'{width}x{round(width * CARD_RATIO)}',
+                crop='center',
+                upscale=True,
+                format=image_format,
+                quality=SRCSET_QUALITY,
+            )
+            candidates.append(f'{thumbnail.url} {thumbnail.width}w')
+        result[key] = ', '.join(candidates)
+    return result
+
+
+def generate(name):
+    """Делает все миниатюры файла и записывает манифест."""
+    manifest = {}
+    try:
+        for alias, (geometry, options) in RENDITIONS.items():
+            thumbnail = get_thumbnail(name, geometry, **options)
+            manifest[alias] = {
+                'url': thumbnail.url,
+                'width': thumbnail.width,
+                'height': thumbnail.height,
+            }
+        manifest['srcset'] = srcset(name)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', name)
+        manifest = {}
+    posts = Post.objects.filter(image=name)
+    posts.update(renditions=json.dumps({'name': name, **manifest}))
+    # Карточки, отрисованные без миниатюр, больше не актуальны.
+    caching.forget_cards(posts.values_list('pk', 'version'))
+    caching.bump_feed_version()
+    return manifest
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Ошибка фоновой обработки %s', name)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+        connections.close_all()
+
+
+def _submit(name):
+    global _executor
+    if not settings.POSTS_THUMBNAIL_WORKERS:
+        try:
+            generate(name)
+        except Exception:
+            logger.exception('Ошибка обработки %s', name)
+        return
+    with _pending_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _executor.submit(_run, name)
+
+
+def schedule(name):
+    """Ставит файл в очередь фонового пула после фиксации транзакции,
+    чтобы пул увидел сохранённый пост."""
+    if name:
+        transaction.on_commit(lambda: _submit(name))
@@ -0,0 +1,361 @@
+"""Лента подписок с рассылкой постов при публикации (fan-out-on-write).
+
+Пост обычного автора при публикации записывается в TimelineEntry
+каждого подписчика, и страница ленты читается по индексу
+(user, -created, -post): сначала ключи записей, потом сами посты по id.
+Посты авторов, у которых подписчиков больше FANOUT_FOLLOWERS_LIMIT, не
+рассылаются: лента читает их отдельным запросом по индексу
+(author, -created) и сливает с записями.
+
+При подписке (backfill) и когда автор снова становится обычным
+(refill), в ленты копируются только BACKFILL_POSTS его новейших постов,
+а ключ самого нового из остальных запоминается в подписке
+(missing_from). Начиная с самого нового такого ключа подписчика
+(горизонта) и ниже лента читает посты подписок напрямую, как до
+рассылки, поэтому из ленты ничего не пропадает, а подписка и отписка
+пишут не больше BACKFILL_POSTS строк на подписчика.
+"""
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+
+from . import counters
+from .models import Counter, Follow, Post, TimelineEntry
+
+FANOUT_FOLLOWERS_LIMIT = 1000
+BATCH_SIZE = 500
+# Сколько новейших постов автора копируется в ленту: несколько страниц.
+BACKFILL_POSTS = 100
+# Допустимые сортировки FollowFeed: по убыванию или возрастанию ключа.
+ORDERINGS = {('-created', '-pk'): True, ('created', 'pk'): False}
+KEY_OPERATORS = {'lt': '<', 'lte': '<=', 'gt': '>'}
+
+
+def is_celebrity(author_id):
+    followers = counters.get_count(counters.FOLLOWERS, author_id)
+    return followers > FANOUT_FOLLOWERS_LIMIT
+
+
+def fan_out(post):
+    """Рассылает новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post.pk,
+                       created=post.created)
+         for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _copy_recent(follows):
+    """Записывает в ленты подписчиков по подпискам follows не больше
+    BACKFILL_POSTS новейших постов автора и запоминает в подписках
+    ключ самого нового из нескопированных. Два запроса на любое число
+    подписок."""
+    ops = connection.ops
+    post = ops.quote_name(Post._meta.db_table)
+    follows_sql, follows_params = follows.values_list(
+        'user_id', 'author_id'
+    ).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{ops.quote_name(TimelineEntry._meta.db_table)} '
+            f'(user_id, post_id, created) '
+            f'SELECT follows.user_id, {post}.id, {post}.created '
+            f'FROM ({follows_sql}) AS follows INNER JOIN {post} '
+            f'ON {post}.id IN (SELECT recent.id FROM {post} AS recent '
+            f'WHERE recent.author_id = follows.author_id '
+            f'ORDER BY recent.created DESC, recent.id DESC LIMIT %s) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            [*follows_params, BACKFILL_POSTS],
+        )
+    missing = Post.objects.filter(
+        author_id=OuterRef('author_id')
+    ).order_by('-created', '-pk')[BACKFILL_POSTS:BACKFILL_POSTS + 1]
+    follows.update(
+        missing_from=Subquery(missing.values('created')),
+        missing_from_post=Subquery(missing.values('pk')),
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика посты нового автора."""
+    backfill_many(user_id, [author_id])
+
+
+def backfill_many(user_id, author_ids):
+    """backfill для многих авторов; популярные пропускаются — их посты
+    лента читает напрямую."""
+    author_ids = list(author_ids)
+    if not author_ids:
+        return
+    celebrities = Counter.objects.filter(
+        name=counters.FOLLOWERS, value__gt=FANOUT_FOLLOWERS_LIMIT
+    ).values('object_id')
+    _copy_recent(Follow.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).exclude(author_id__in=celebrities))
+
+
+def refill(author_ids):
+    """Дописывает в ленты подписчиков новейшие посты авторов, у которых
+    подписчиков стало ровно FANOUT_FOLLOWERS_LIMIT, то есть они только
+    что перестали быть популярными. Их посты, написанные без рассылки,
+    иначе пропали бы из лент. Вызывается после уменьшения счётчика;
+    пишет не больше BACKFILL_POSTS строк на подписчика."""
+    crossed = list(Counter.objects.filter(
+        name=counters.FOLLOWERS,
+        object_id__in=list(author_ids),
+        value=FANOUT_FOLLOWERS_LIMIT,
+    ).values_list('object_id', flat=True))
+    if crossed:
+        _copy_recent(Follow.objects.filter(author_id__in=crossed))
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    prune_many(user_id, [author_id])
+
+
+def prune_many(user_id, author_ids):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id__in=author_ids
+    ).delete()
+
+
+def _key_filter(queryset, op, created, pk, pk_field):
+    """Условие на ключ (created, id) сравнением пар: база читает индекс
+    диапазоном и сразу в его порядке. op — lt, lte или gt."""
+    ops = connection.ops
+    meta = queryset.model._meta
+    column = meta.pk.column if pk_field == 'pk' else (
+        meta.get_field(pk_field).column
+    )
+    table = ops.quote_name(meta.db_table)
+    return queryset.extra(
+        where=[
+            f'({table}.{ops.quote_name("created")}, '
+            f'{table}.{ops.quote_name(column)}) {KEY_OPERATORS[op]} (%s, %s)'
+        ],
+        params=[ops.adapt_datetimefield_value(created), pk],
+    )
+
+
+class FollowFeed:
+    """Посты ленты подписок для пагинаторов и API.
+
+    Повторяет ту часть интерфейса QuerySet, которой пользуются ленты:
+    срезы, order_by по ключу (created, id), values_list, for_feed,
+    explain и курсоры older_than / newer_than. На страницу три
+    запроса: горизонт ленты, ключи (created, id) из индекса записей
+    ленты вместе с ключами постов популярных авторов, потом сами посты
+    по id. Страницы ниже горизонта читают ключи из постов подписок.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.bound = None
+        self.descending = True
+        self.start = 0
+        self.stop = None
+        self.fields = None
+        self.feed_fields = False
+        self._result = None
+
+    def _clone(self, **changes):
+        clone = FollowFeed(self.user)
+        clone.__dict__.update(self.__dict__, _result=None, **changes)
+        return clone
+
+    def for_feed(self):
+        return self._clone(feed_fields=True)
+
+    def values_list(self, *fields):
+        return self._clone(fields=fields)
+
+    def order_by(self, *fields):
+        return self._clone(descending=ORDERINGS[fields])
+
+    def older_than(self, created, pk):
+        return self._clone(bound=('lt', created, pk))
+
+    def newer_than(self, created, pk):
+        return self._clone(bound=('gt', created, pk))
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return list(self)[key]
+        if key.step is not None or (key.start or 0) < 0 or (
+                key.stop is not None and key.stop < 0):
+            raise ValueError('Поддерживаются только срезы без шага.')
+        start = self.start + (key.start or 0)
+        stop = None if key.stop is None else self.start + key.stop
+        if self.stop is not None:
+            stop = self.stop if stop is None else min(stop, self.stop)
+        return self._clone(start=start, stop=stop)
+
+    def __iter__(self):
+        if self._result is None:
+            self._result = self._fetch()
+        return iter(self._result)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def iterator(self, chunk_size=None):
+        return iter(self)
+
+    def _horizon(self):
+        """Самый новый ключ, начиная с которого в записях ленты есть не
+        все посты подписок, или None, если записи полны."""
+        return Follow.objects.filter(
+            user=self.user, missing_from__isnull=False
+        ).order_by(
+            '-missing_from', '-missing_from_post'
+        ).values_list('missing_from', 'missing_from_post').first()
+
+    def _keyed(self, queryset, pk_field):
+        if self.bound is not None:
+            queryset = _key_filter(queryset, *self.bound, pk_field)
+        sign = '-' if self.descending else ''
+        return queryset.order_by(
+            f'{sign}created', f'{sign}{pk_field}'
+        ).values_list('created', pk_field)[:self.stop]
+
+    def _entry_queries(self, horizon):
+        """Записи ленты и посты популярных авторов новее горизонта."""
+        followed = Follow.objects.filter(user=self.user).values('author_id')
+        celebrities = Counter.objects.filter(
+            name=counters.FOLLOWERS,
+            object_id__in=followed,
+            value__gt=FANOUT_FOLLOWERS_LIMIT,
+        ).values('object_id')
+        entries = TimelineEntry.objects.filter(user=self.user)
+        posts = Post.objects.filter(author_id__in=celebrities)
+        if horizon is not None:
+            entries = _key_filter(entries, 'gt', *horizon, 'post_id')
+            posts = _key_filter(posts, 'gt', *horizon, 'pk')
+        return [
+            self._keyed(entries, 'post_id'),
+            self._keyed(posts, 'pk'),
+        ]
+
+    def _direct_query(self, horizon):
+        """Посты подписок с горизонта и старше, прямо из постов."""
+        followed = Follow.objects.filter(user=self.user).values('author_id')
+        return self._keyed(
+            _key_filter(
+                Post.objects.filter(author_id__in=followed),
+                'lte', *horizon, 'pk',
+            ),
+            'pk',
+        )
+
+    def _keys_sql(self, queries):
+        """Один запрос на ключи: каждая часть читается по своему
+        индексу с LIMIT, сортируются только их строки."""
+        parts = []
+        params = []
+        for query in queries:
+            sql, query_params = query.query.sql_with_params()
+            parts.append(f'SELECT * FROM ({sql})')
+            params += query_params
+        direction = 'DESC' if self.descending else 'ASC'
+        return (
+            f'{" UNION ALL ".join(parts)} '
+            f'ORDER BY 1 {direction}, 2 {direction}',
+            params,
+        )
+
+    def _segments(self, horizon):
+        """Части ленты в порядке выдачи: выше горизонта — записи,
+        ниже — посты подписок."""
+        if horizon is None:
+            return [self._entry_queries(horizon)]
+        segments = [self._entry_queries(horizon),
+                    [self._direct_query(horizon)]]
+        return segments if self.descending else segments[::-1]
+
+    def _keys(self):
+        """id постов страницы по (created, id). Пост популярного автора
+        может быть и в записях, если его разослали до того, как у
+        автора стало много подписчиков, — повторы пропускаются. Часть
+        ниже горизонта читается, только если выше не хватило постов."""
+        if self.stop is not None and self.stop <= self.start:
+            return []
+        seen = set()
+        ids = []
+        for queries in self._segments(self._horizon()):
+            sql, params = self._keys_sql(queries)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                keys = cursor.fetchall()
+            for _, pk in keys:
+                if pk not in seen:
+                    seen.add(pk)
+                    ids.append(pk)
+            if self.stop is not None and len(ids) >= self.stop:
+                break
+        return ids[self.start:self.stop]
+
+    def _fetch(self):
+        ids = self._keys()
+        if not ids:
+            return []
+        posts = Post.objects.filter(pk__in=ids)
+        if self.fields is not None:
+            rows = posts.values_list('pk', *self.fields)
+            found = {row[0]: row[1:] for row in rows}
+        else:
+            if self.feed_fields:
+                posts = posts.for_feed()
+            found = {post.pk: post for post in posts}
+        return [found[pk] for pk in ids if pk in found]
+
+    def explain(self):
+        """План запроса ключей первой части ленты."""
+        sql, params = self._keys_sql(self._segments(self._horizon())[0])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params
+            )
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+
+
+def feed(user):
+    """Посты ленты подписок: записи ленты плюс посты популярных
+    авторов, которые читаются напрямую."""
+    return FollowFeed(user)
+
+
+def rebuild():
+    """Пересобирает все ленты по текущим подпискам: все посты обычных
+    авторов, без горизонта."""
+    ops = connection.ops
+    follow = ops.quote_name(Follow._meta.db_table)
+    post = ops.quote_name(Post._meta.db_table)
+    counter = ops.quote_name(Counter._meta.db_table)
+    TimelineEntry.objects.all().delete()
+    Follow.objects.update(missing_from=None, missing_from_post=None)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{ops.quote_name(TimelineEntry._meta.db_table)} '
+            f'(user_id, post_id, created) '
+            f'SELECT {follow}.user_id, {post}.id, {post}.created '
+            f'FROM {follow} INNER JOIN {post} '
+            f'ON {post}.author_id = {follow}.author_id '
+            f'WHERE {follow}.author_id NOT IN ('
+            f'SELECT object_id FROM {counter} '
+            f'WHERE name = %s AND value > %s) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}',
+            [counters.FOLLOWERS, FANOUT_FOLLOWERS_LIMIT],
+        )
@@ -0,0 +1,66 @@
+"""Загрузка картинок постов с ограничением размера.
+
+Файл пишется кусками во временный файл на диске, а не в память.
+Как только размер превышает POSTS_IMAGE_MAX_SIZE, запись прекращается,
+временный файл удаляется, а поле попадает в request.rejected_uploads,
+чтобы форма показала ошибку. По каждому файлу в лог пишутся размер,
+время приёма и скорость.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл во временный файл и бросает его после лимита."""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.POSTS_IMAGE_MAX_SIZE
+        if request is not None and not hasattr(request, 'rejected_uploads'):
+            request.rejected_uploads = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.started = time.perf_counter()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.file.close()
+            self.request.rejected_uploads[self.field_name] = self.received
+            logger.info(
+                'Загрузка %s отклонена: больше %s байт',
+                self.file_name, self.max_size,
+            )
+            raise SkipFile
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        elapsed = time.perf_counter() - self.started
+        logger.info(
+            'Загружен %s: %s байт за %.3f с (%.2f МБ/с)',
+            self.file_name, file_size, elapsed,
+            file_size / (elapsed or 1e-9) / 2**20,
+            extra={
+                'upload_size': file_size,
+                'upload_seconds': elapsed,
+            },
+        )
+        return super().file_complete(file_size)
+
+
+def use_bounded_handler(request):
+    """Ставит ограниченный обработчик вместо стандартных.
+
+    Вызывать до первого обращения к request.POST/FILES, поэтому вьюхи
+    с загрузкой проверяют CSRF сами, после замены обработчиков.
+    """
+    request.upload_handlers = [BoundedUploadHandler(request)]
@@ -1,12 +1,186 @@
+import base64
+import binascii
+
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 
 POSTS_NUMBER: int = 10
 # posts_per_page = (10)
+COMMENTS_NUMBER = 20
+# Больше комментариев за один запрос подгрузки не отдаётся.
+COMMENTS_MAX_LIMIT = 100
+CURSOR_PARAM = 'cursor'
+# Наибольший id, который помещается в целое базы (64 бита со знаком).
+MAX_ID = 2 ** 63 - 1
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, obj):
+    """Непрозрачный курсор: направление и ключ (created, id) записи."""
+    return encode_key(direction, obj.created, obj.pk)
+
+
+def encode_key(direction, created, pk):
+    """Курсор по значениям ключа, для строк values_list()."""
+    raw = f'{direction}|{created.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор. Для испорченного курсора возвращает None."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, created, pk = raw.decode().split('|')
+        created = parse_datetime(created)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or created is None:
+        return None
+    if not 1 <= pk <= MAX_ID:
+        return None
+    return direction, created, pk
+
+
+def older_than(queryset, created, pk):
+    """Записи старше ключа (created, id). Ленты, которые собираются не
+    одним запросом (timeline.FollowFeed), фильтруют себя сами."""
+    if hasattr(queryset, 'older_than'):
+        return queryset.older_than(created, pk)
+    return queryset.filter(
+        Q(created__lt=created) | Q(created=created, pk__lt=pk)
+    )
+
+
+def newer_than(queryset, created, pk):
+    """Записи новее ключа (created, id)."""
+    if hasattr(queryset, 'newer_than'):
+        return queryset.newer_than(created, pk)
+    return queryset.filter(
+        Q(created__gt=created) | Q(created=created, pk__gt=pk)
+    )
+
+
+class KeysetPage:
+    """Страница курсорной пагинации.
+
+    Повторяет ту часть интерфейса Page, которой пользуются шаблоны.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
 
+    def has_next(self):
+        return self.next_cursor is not None
 
-def paginat(request, post):
-    paginator = Paginator(post, POSTS_NUMBER)
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Пагинация по ключу (created, id) без COUNT и OFFSET.
+
+    Каждая страница — это один запрос по индексу от позиции курсора,
+    поэтому глубина страницы не влияет на время ответа.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._page(self._newest(), has_newer=False)
+        direction, created, pk = position
+        if direction == NEXT:
+            older = older_than(self.object_list, created, pk)
+            return self._page(older.order_by('-created', '-pk'))
+        newer = newer_than(
+            self.object_list, created, pk
+        ).order_by('created', 'pk')
+        rows = list(newer[:self.per_page + 1])
+        has_newer = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return self._build(rows, has_older=True, has_newer=has_newer)
+
+    def _newest(self):
+        return self.object_list.order_by('-created', '-pk')
+
+    def _page(self, queryset, has_newer=True):
+        rows = list(queryset[:self.per_page + 1])
+        has_older = len(rows) > self.per_page
+        return self._build(rows[:self.per_page], has_older, has_newer)
+
+    def _build(self, rows, has_older, has_newer):
+        if not rows:
+            return KeysetPage(rows)
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(NEXT, rows[-1]) if has_older else None,
+            previous_cursor=(
+                encode_cursor(PREVIOUS, rows[0]) if has_newer else None
+            ),
+        )
+
+
+class CountedPaginator(Paginator):
+    """Paginator, которому число записей передаётся готовым
+    (из денормализованного счётчика), без COUNT(*) по таблице."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.__dict__['count'] = count
+
+
+def paginat(request, post, keyset=None, count=None):
+    if keyset is None:
+        keyset = (
+            settings.POSTS_KEYSET_PAGINATION or CURSOR_PARAM in request.GET
+        )
+    if keyset:
+        paginator = KeysetPaginator(post, POSTS_NUMBER)
+        return paginator.get_page(request.GET.get(CURSOR_PARAM))
+    paginator = CountedPaginator(post, POSTS_NUMBER, count=count)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def page_key(request, page_obj):
+    """Часть ключа кэша страницы ленты: номер страницы или курсор, без
+    посторонних параметров адреса. Курсор пересобирается из
+    разобранного ключа, испорченный означает первую страницу."""
+    if not getattr(page_obj, 'is_keyset', False):
+        return f'page:{page_obj.number}'
+    cursor = request.GET.get(CURSOR_PARAM)
+    position = decode_cursor(cursor) if cursor else None
+    if position is None:
+        return CURSOR_PARAM
+    return f'{CURSOR_PARAM}:{encode_key(*position)}'
+
+
+def comments_page(post, cursor=None, limit=COMMENTS_NUMBER):
+    """Страница комментариев поста, от новых к старым, с авторами."""
+    comments = post.comments.select_related('author')
+    return KeysetPaginator(comments, limit).get_page(cursor)
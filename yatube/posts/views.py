@@ -1,66 +1,131 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import etag
 
+from . import (archive, caching, counters, etags, follows, timeline,
+               uploads)
 from .forms import CommentForm, CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import paginat
+from .models import Group, Post, User
+from .search import search_groups, search_posts
+from .utils import (COMMENTS_MAX_LIMIT, COMMENTS_NUMBER, CURSOR_PARAM,
+                    comments_page, page_key, paginat)
 
 
-@cache_page(20, key_prefix='index_page')
+@etag(etags.index)
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = paginat(request, post_list)
+    post_list = Post.objects.for_feed()
+    page_obj = paginat(
+        request, post_list, count=counters.get_count(counters.POSTS)
+    )
     context = {
         'page_obj': page_obj,
+        'feed_version': caching.feed_version(),
+        'page_key': page_key(request, page_obj),
     }
     return render(request, 'posts/index.html', context)
     # тут висела надпись "исправить" но что именно не было написано
 
 
+@etag(etags.group_posts)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_posts = group.posts.all()
-    page_obj = paginat(request, group_posts)
+    group_posts = group.posts.for_feed()
+    posts_count = counters.get_count(counters.GROUP_POSTS, group.pk)
+    page_obj = paginat(request, group_posts, count=posts_count)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'posts_count': posts_count,
         'show_profile_link': True,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@etag(etags.profile)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts_author = author.posts.all()
-    page_obj = paginat(request, posts_author)
+    posts_author = author.posts.for_feed()
+    posts_count = counters.get_count(counters.AUTHOR_POSTS, author.pk)
+    page_obj = paginat(request, posts_author, count=posts_count)
     cannot_follow = request.user == author
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': request.user.is_authenticated and request.user.follower.
-        filter(author=author).exists(),
+        'posts_count': posts_count,
+        'following': follows.is_following(request.user, author.pk),
         'cannot_follow': cannot_follow,
         'show_group_link': True,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@etag(etags.post_detail)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
     form_comment = CommentForm(request.POST or None)
     context = {
         'post': post,
+        'comments': comments_page(post, request.GET.get(CURSOR_PARAM)),
+        'comments_count': counters.get_count(
+            counters.POST_COMMENTS, post.pk
+        ),
+        'author_posts_count': counters.get_count(
+            counters.AUTHOR_POSTS, post.author_id
+        ),
         'form_comment': form_comment,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующие комментарии поста для подгрузки: HTML-фрагмент
+    или JSON (?format=json). Не больше COMMENTS_MAX_LIMIT за раз."""
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    try:
+        limit = int(request.GET.get('limit', COMMENTS_NUMBER))
+    except ValueError:
+        limit = COMMENTS_NUMBER
+    limit = min(max(limit, 1), COMMENTS_MAX_LIMIT)
+    comments = comments_page(post, request.GET.get(CURSOR_PARAM), limit)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor,
+        }, json_dumps_params={'ensure_ascii': False})
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    return render(request, 'includes/comments.html', context)
+
+
 @login_required
+@csrf_exempt
 def post_create(request):
+    uploads.use_bounded_handler(request)
+    return _post_create(request)
+
+
+@csrf_protect
+def _post_create(request):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
+        rejected_uploads=getattr(request, 'rejected_uploads', None),
     )
     context = {'form': form}
     if not form.is_valid():
@@ -73,12 +138,20 @@ def post_create(request):
 
 
 @login_required
+@csrf_exempt
 def post_edit(request, post_id):
+    uploads.use_bounded_handler(request)
+    return _post_edit(request, post_id)
+
+
+@csrf_protect
+def _post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
         instance=post,
+        rejected_uploads=getattr(request, 'rejected_uploads', None),
     )
     context = {
         'form': form,
@@ -89,7 +162,7 @@ def post_edit(request, post_id):
             form.save()
             return redirect('posts:post_detail', post.pk)
         return render(request, 'posts/post_create.html', context)
-    return render(request, 'posts/post_detail.html', context)
+    return redirect('posts:post_detail', post.pk)
 
 
 @login_required
@@ -108,10 +181,12 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    favorite_post_list = Post.objects.filter(
-        author__following__user=request.user
+    favorite_post_list = timeline.feed(request.user).for_feed()
+    page_obj = paginat(
+        request,
+        favorite_post_list,
+        count=counters.get_follow_count(request.user),
     )
-    page_obj = paginat(request, favorite_post_list)
     context = {
         'page_obj': page_obj,
         'favorite_post_list': favorite_post_list,
@@ -120,25 +195,52 @@ def follow_index(request):
     return render(request, 'posts/follow.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = paginat(request, search_posts(query), keyset=False)
+    context = {
+        'query': query,
+        'groups': search_groups(query),
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author == request.user:
-        return redirect('posts:profile', username=username)
-    else:
-        follow, created = Follow.objects.get_or_create(
-            user=request.user,
-            author=author,
-        )
-        return redirect('posts:profile', username=username)
+    # Несуществующего автора покажет 404 на странице профиля.
+    follows.follow(request.user, [username])
+    return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
+    follows.unfollow(request.user, [username])
+    return redirect('posts:profile', username=username)
+
+
+@login_required
+def profile_export(request, username):
+    """Архив своих постов и комментариев файлом NDJSON или CSV
+    (?format=csv), потоком и с ограничением скорости."""
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(
-        user=request.user,
-        author=author,
+    if request.user != author:
+        return redirect('posts:profile', username=username)
+    file_format = request.GET.get('format')
+    if file_format not in archive.FORMATS:
+        file_format = archive.FORMATS[0]
+    if not archive.acquire(author.pk):
+        response = HttpResponse(
+            'Выгрузка уже идёт, попробуйте позже.', status=429
+        )
+        response['Retry-After'] = archive.RETRY_AFTER
+        return response
+    response = StreamingHttpResponse(
+        archive.ArchiveStream(author.pk, file_format),
+        content_type=archive.CONTENT_TYPES[file_format],
     )
-    follow.delete()
-    return redirect('posts:profile', username=username)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{file_format}"'
+    )
+    return response
@@ -50,6 +50,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryLogMiddleware',
+    'core.middleware.ProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,7 +67,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.MeteredTemplates',
+        'NAME': 'django',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,6 +83,20 @@ TEMPLATES = [
     },
 ]
 
+# Кэш скомпилированных шаблонов (cached.Loader): без DEBUG или при
+# YATUBE_TEMPLATE_CACHE=1. Правки шаблонов тогда видны после перезапуска.
+TEMPLATE_CACHE = (
+    not DEBUG or os.environ.get('YATUBE_TEMPLATE_CACHE') == '1'
+)
+if TEMPLATE_CACHE:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -144,8 +162,129 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Кэш: locmem — в каждом процессе свой; shared — общий для воркеров
+# (по умолчанию SQLite-файл, можно указать любой бэкенд, например Redis);
+# two_tier — LRU процесса перед общим кэшем.
+#
+# Размеры. На пост, который показывается в лентах, приходится до пяти
+# ключей (четыре варианта карточки и версия поста), на автора и
+# группу — версия, на читателя — множество его подписок, на страницу
+# ленты — фрагмент под каждой версией ленты. Стандартные 300 записей
+# BaseCache вытесняли бы карточки раньше, чем они пригодятся. Locmem
+# держит CACHE_LOCAL_MAX_ENTRIES записей в каждом процессе (карточка —
+# около 2 КБ, всего десятки МБ) и при переполнении удаляет старейшую
+# 1/CULL_FREQUENCY часть. Общий кэш на диске больше и чистится
+# мельче: удаляются сначала истёкшие и ближайшие к истечению записи,
+# версии без срока — последними.
+CACHE_LOCAL_MAX_ENTRIES = 20000
+CACHE_SHARED_MAX_ENTRIES = 500000
+CACHE_MODE = os.environ.get('YATUBE_CACHE', 'locmem')
+SHARED_CACHE = {
+    'BACKEND': os.environ.get(
+        'YATUBE_SHARED_CACHE_BACKEND', 'core.cache_backends.SQLiteCache'
+    ),
+    'LOCATION': os.environ.get(
+        'YATUBE_SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+    ),
+    'OPTIONS': {
+        'MAX_ENTRIES': CACHE_SHARED_MAX_ENTRIES,
+        'CULL_FREQUENCY': 10,
+    },
+}
+
+if CACHE_MODE == 'two_tier':
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_MAX_ENTRIES': CACHE_LOCAL_MAX_ENTRIES,
+            },
+        },
+        'shared': SHARED_CACHE,
+    }
+elif CACHE_MODE == 'shared':
+    CACHES = {'default': SHARED_CACHE}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {
+                'MAX_ENTRIES': CACHE_LOCAL_MAX_ENTRIES,
+                'CULL_FREQUENCY': 4,
+            },
+        }
     }
+
+# Кэш по умолчанию — обёртка, которая считает попадания и промахи
+# для замеров запросов; сам кэш доступен под алиасом 'metered'.
+CACHES['metered'] = CACHES['default']
+CACHES['default'] = {
+    'BACKEND': 'core.cache_backends.MeteredCache',
+    'OPTIONS': {'CACHE': 'metered'},
+}
+
+# Замеры запросов (core.middleware.MetricsMiddleware). Заголовок
+# Server-Timing отдаётся всем при METRICS_SERVER_TIMING, иначе только
+# staff. Перцентили считаются по последним METRICS_WINDOW запросам
+# каждого адреса. Если задан METRICS_DUMP_PATH, сводка пишется туда
+# не чаще раза в METRICS_DUMP_INTERVAL секунд ({pid} — номер процесса).
+METRICS_SERVER_TIMING = DEBUG
+METRICS_WINDOW = 1000
+METRICS_DUMP_PATH = os.environ.get('YATUBE_METRICS_DUMP_PATH')
+METRICS_DUMP_INTERVAL = 60
+
+# Журнал запросов (core.middleware.QueryLogMiddleware): запросы дольше
+# SLOW_QUERY_MS мс пишутся в лог с местом вызова, а запрос одной формы,
+# повторённый за ответ DUPLICATE_QUERY_THRESHOLD раз, — как вероятный
+# N+1. QUERY_BUDGETS — предел числа запросов адреса с холодным кэшем;
+# при QUERY_BUDGETS_STRICT превышение — исключение (так их запускает
+# manage.py test, см. TEST_RUNNER). Порог повторов выше трёх: новый
+# пост законно обновляет три счётчика одной формой запроса.
+SLOW_QUERY_MS = 100
+DUPLICATE_QUERY_THRESHOLD = 5
+QUERY_BUDGETS = {
+    'posts:index': 5,
+    'posts:group_list': 6,
+    'posts:profile': 7,
+    'posts:post_detail': 7,
+    'posts:comments': 4,
+    # Страницы ниже горизонта ленты читают ключи ещё и из постов.
+    'posts:follow_index': 8,
+    'posts:search': 7,
 }
+QUERY_BUDGETS_STRICT = False
+TEST_RUNNER = 'core.test_runner.QueryBudgetRunner'
+
+# Выборочный профилировщик (core.profiler): шаг выборки, предельная
+# длительность замера и каталог, куда при остановке пишутся стеки.
+PROFILER_INTERVAL_MS = 10
+PROFILER_MAX_SECONDS = 300
+PROFILER_OUTPUT_DIR = os.environ.get('YATUBE_PROFILER_OUTPUT_DIR')
+
+# Потоки фоновой подготовки миниатюр; 0 — готовить сразу, без пула.
+POSTS_THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+# Ограничения для картинок постов: размер файла, сторона и число
+# пикселей (защита от «бомб» с огромным разрешением).
+POSTS_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+POSTS_IMAGE_MAX_SIDE = 8000
+POSTS_IMAGE_MAX_PIXELS = 24_000_000
+POSTS_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Бэкенд поиска: 'fts' — SQLite FTS5, если он есть, иначе обратный
+# индекс в таблице; 'index' — всегда таблица. После смены бэкенда
+# нужно запустить rebuild_search_index.
+POSTS_SEARCH_BACKEND = 'fts'
+
+# Карточки постов в лентах собираются на Python (posts.cards), а не
+# шаблоном includes/post.html на каждую карточку.
+POSTS_FAST_CARDS = True
+
+# Выгрузка архива автора: одновременных выгрузок на процесс и
+# строк в секунду на выгрузку (0 — без ограничения).
+POSTS_EXPORT_CONCURRENCY = 2
+POSTS_EXPORT_ROWS_PER_SECOND = 20000
+
+# Курсорная пагинация лент (?cursor=...) вместо постраничной (?page=...).
+POSTS_KEYSET_PAGINATION = False